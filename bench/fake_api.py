@@ -0,0 +1,108 @@
+import asyncio
+import itertools
+import random
+import time
+from typing import Any
+
+from aiohttp import web
+
+
+class FakeBotAPI:
+    """Локальная замена Bot API: отвечает как Telegram, но с управляемой задержкой и ошибками."""
+
+    def __init__(self,
+                 latency: float = 0.05,
+                 jitter: float = 0.02,
+                 flood_rate: float = 0.0,
+                 forbidden_rate: float = 0.0,
+                 retry_after: int = 1,
+                 protected_chats: frozenset[int] = frozenset()) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.forbidden_rate = forbidden_rate
+        self.retry_after = retry_after
+        # Служебные чаты (например, админ) ошибок не получают, иначе падает сам сценарий.
+        self.protected_chats = protected_chats
+        self.requests: dict[str, int] = {}
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+
+    def _message(self, chat_id: int, **extra: Any) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            **extra,
+        }
+
+    def _file(self, **extra: Any) -> dict:
+        file_id = f"fake-file-{next(self._file_ids)}"
+        return {"file_id": file_id, "file_unique_id": file_id, **extra}
+
+    def _result(self, method: str, params: dict) -> Any:
+        chat_id = int(params.get("chat_id", 0) or 0)
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+        if method == "getChat":
+            return {"id": chat_id, "type": "private", "first_name": f"User {chat_id}", "accent_color_id": 0,
+                    "max_reaction_count": 0,
+                    "accepted_gift_types": {"unlimited_gifts": True, "limited_gifts": True,
+                                            "unique_gifts": True, "premium_subscription": True,
+                                            "gifts_from_channels": True}}
+        if method in ("deleteMessage", "deleteWebhook", "setWebhook", "answerCallbackQuery"):
+            return True
+        if method == "copyMessage":
+            return {"message_id": next(self._message_ids)}
+        if method == "sendPhoto":
+            return self._message(chat_id, photo=[self._file(width=1280, height=720)])
+        if method == "sendVideo":
+            return self._message(chat_id, video=self._file(width=1280, height=720, duration=10))
+        if method == "sendAudio":
+            return self._message(chat_id, audio=self._file(duration=10))
+        if method == "sendDocument":
+            return self._message(chat_id, document=self._file())
+        if method == "sendMediaGroup":
+            return [self._message(chat_id, photo=[self._file(width=1280, height=720)])]
+        return self._message(chat_id, text=params.get("text") or params.get("caption") or "")
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.requests[method] = self.requests.get(method, 0) + 1
+        params = dict(await request.post())
+
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        chat_id = int(params.get("chat_id", 0) or 0)
+        if (method.startswith("send") or method == "copyMessage") and chat_id not in self.protected_chats:
+            roll = random.random()
+            if roll < self.flood_rate:
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }, status=429)
+            if roll < self.flood_rate + self.forbidden_rate:
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 403,
+                    "description": "Forbidden: bot was blocked by the user",
+                }, status=403)
+
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host=host, port=port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{bound_port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,285 @@
+"""
+Нагрузочный прогон рассылок против локального фейкового Bot API.
+
+    python -m bench.run --users 10000 100000 --latency 0.05 --flood-rate 0.01 --forbidden-rate 0.02
+
+База создаётся во временном каталоге, реальные пользователи не затрагиваются.
+Отправлено/не доставлено и время базы берутся из tasks и shard_leases, поэтому учитывают
+и процессы шардов (BROADCAST_SHARDS > 1); задержки и память — только главного процесса.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_ID = 10 ** 12
+TOKEN = "42:benchmark"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк рассылок на фейковом Bot API")
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--scenarios", nargs="+", default=["news", "media", "album", "scheduled", "scheduled_media"],
+                        choices=["news", "media", "album", "scheduled", "scheduled_media"])
+    parser.add_argument("--latency", type=float, default=0.05, help="средняя задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--forbidden-rate", type=float, default=0.0, help="доля ответов 403")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--global-rate", type=float, default=1_000_000,
+                        help="глобальный лимит, по умолчанию фактически снят")
+    parser.add_argument("--output", default=None, help="дописать отчёт в файл")
+    return parser.parse_args()
+
+
+def prepare_environment(args: argparse.Namespace) -> str:
+    # config и database.models читаются при импорте, поэтому окружение готовим заранее.
+    os.environ["BROADCAST_GLOBAL_RATE"] = str(args.global_rate)
+    os.environ["METRICS_PORT"] = "0"
+    if args.workers:
+        os.environ["BROADCAST_WORKERS"] = str(args.workers)
+
+    workdir = tempfile.mkdtemp(prefix="newsletter-bench-")
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    return workdir
+
+
+def seed_users(path: str, count: int) -> None:
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("DELETE FROM users")
+        connection.execute("DELETE FROM deliveries")
+        connection.execute("DELETE FROM stats")
+        now = datetime.now().isoformat(sep=" ")
+        rows = ((index, False, now) for index in range(1, count + 1))
+        connection.executemany("INSERT INTO users (tg_id, is_client, created_at) VALUES (?, ?, ?)", rows)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def last_task_id(path: str) -> int:
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT COALESCE(MAX(id), 0) FROM tasks").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def task_totals(path: str, after_id: int) -> tuple[int, int, float]:
+    """Отправлено, не доставлено и время базы в шардах по задачам сценария."""
+    connection = sqlite3.connect(path)
+    try:
+        sent, failed = connection.execute(
+            "SELECT COALESCE(SUM(sent_count), 0), COALESCE(SUM(failed_count), 0) FROM tasks WHERE id > ?",
+            (after_id,)
+        ).fetchone()
+        shard_db_seconds, = connection.execute(
+            "SELECT COALESCE(SUM(db_seconds), 0) FROM shard_leases WHERE task_id > ?", (after_id,)
+        ).fetchone()
+        return sent, failed, shard_db_seconds
+    finally:
+        connection.close()
+
+
+class LatencyRecorder(BaseRequestMiddleware):
+    """
+    Сырые задержки отправок получателям: гистограмма из helpers.metrics слишком груба для p99.
+    Считаются send* (в том числе sendMediaGroup) и copyMessage; превью и статус у админа не в счёт.
+    """
+
+    def __init__(self) -> None:
+        self.samples: list[float] = []
+
+    def reset(self) -> None:
+        self.samples = []
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    async def __call__(self,
+                       make_request: NextRequestMiddlewareType,
+                       bot: Bot,
+                       method: TelegramMethod):
+        name = method.__api_method__
+        if not (name.startswith("send") or name == "copyMessage") or getattr(method, "chat_id", None) == ADMIN_ID:
+            return await make_request(bot, method)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            self.samples.append(time.perf_counter() - started)
+
+
+@dataclass
+class Report:
+    scenario: str
+    users: int
+    sent: int
+    failed: int
+    seconds: float
+    p50: float
+    p99: float
+    db_seconds: float
+    rss_mb: float
+
+    def line(self) -> str:
+        return (f"{self.scenario:<15} users={self.users:<8} sent={self.sent:<8} failed={self.failed:<6} "
+                f"time={self.seconds:8.2f}s rate={self.sent / max(self.seconds, 1e-9):9.1f} msg/s "
+                f"p50={self.p50 * 1000:7.1f}ms p99={self.p99 * 1000:7.1f}ms "
+                f"db={self.db_seconds:7.2f}s rss={self.rss_mb:7.1f}MB")
+
+
+async def run(args: argparse.Namespace) -> list[Report]:
+    from aiogram.fsm.context import FSMContext
+    from aiogram.fsm.storage.base import StorageKey
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from aiogram.types import Chat, Message, User as TgUser
+
+    import main
+    from bench.fake_api import FakeBotAPI
+    from database.models import async_main
+    from database.requests import init_stats, add_task, get_task
+    from handlers import admin as handlers
+    from helpers import metrics
+    from helpers.apscheduler_message import bind_bot
+
+    server = FakeBotAPI(latency=args.latency,
+                        jitter=args.jitter,
+                        flood_rate=args.flood_rate,
+                        forbidden_rate=args.forbidden_rate,
+                        retry_after=args.retry_after,
+                        protected_chats=frozenset({ADMIN_ID}))
+    api_url = await server.start()
+    os.environ["BOT_API_URL"] = api_url  # для процессов-шардов
+
+    bot = main.create_bot(TOKEN, api_url)
+    recorder = LatencyRecorder()
+    bot.session.middleware(recorder)
+    bind_bot(bot)
+    await async_main()
+
+    admin_chat = Chat(id=ADMIN_ID, type="private")
+    admin_user = TgUser(id=ADMIN_ID, is_bot=False, first_name="Admin")
+    storage = MemoryStorage()
+
+    async def publish(handler, state: FSMContext) -> None:
+        # Хендлер только запускает рассылку в фоне, меряем до её конца.
+        await handler(publish_message(), state)
+        await asyncio.gather(*handlers.background_broadcasts)
+
+    def publish_message() -> Message:
+        return Message(message_id=1, date=datetime.now(), chat=admin_chat, from_user=admin_user,
+                       text="✅ Опубликовать").as_(bot)
+
+    async def wizard_state(data: dict) -> FSMContext:
+        state = FSMContext(storage=storage, key=StorageKey(bot_id=bot.id, chat_id=ADMIN_ID, user_id=ADMIN_ID))
+        await state.set_data(data)
+        return state
+
+    async def news() -> None:
+        state = await wizard_state({"news_message": "Benchmark", "btn_name": "Открыть",
+                                    "btn_link": "https://example.com"})
+        await publish(handlers.publish_news, state)
+
+    async def media() -> None:
+        state = await wizard_state({"media_type": "photo", "media_id": "bench-photo", "caption": "Benchmark",
+                                    "buttons": [{"text": "Открыть", "callback": None,
+                                                 "url": "https://example.com"}]})
+        await publish(handlers.publish_media, state)
+
+    async def album() -> None:
+        photos = [{"type": "photo", "media": f"bench-photo-{index}"} for index in range(4)]
+        state = await wizard_state({"media_type": "photo", "media_id": photos[0]["media"], "album": photos,
+                                    "caption": "Benchmark",
+                                    "buttons": [{"text": "Открыть", "callback": None,
+                                                 "url": "https://example.com"}]})
+        await publish(handlers.publish_media, state)
+
+    async def scheduled() -> None:
+        task_id = await add_task(run_at=(datetime.now() - timedelta(seconds=1)).isoformat(),
+                                 news_text="Benchmark",
+                                 author_id=ADMIN_ID)
+        await handlers.run_scheduled_task(task_id)
+        await asyncio.gather(*handlers.background_broadcasts)
+        assert (await get_task(task_id))["is_executed"]
+
+    async def scheduled_media() -> None:
+        # Задача с файлом идёт через scheduled_send_media.
+        task_id = await add_task(run_at=(datetime.now() - timedelta(seconds=1)).isoformat(),
+                                 news_text="Benchmark",
+                                 file_data="bench-photo",
+                                 media_type="photo",
+                                 author_id=ADMIN_ID)
+        await handlers.run_scheduled_task(task_id)
+        await asyncio.gather(*handlers.background_broadcasts)
+        assert (await get_task(task_id))["is_executed"]
+
+    scenarios = {"news": news, "media": media, "album": album, "scheduled": scheduled,
+                 "scheduled_media": scheduled_media}
+    reports = []
+    try:
+        for users in args.users:
+            for name in args.scenarios:
+                seed_users("db.sqlite3", users)
+                await init_stats()
+                recorder.reset()
+                metrics.db_latency.sums.clear()
+                tasks_before = last_task_id("db.sqlite3")
+
+                started = time.perf_counter()
+                await scenarios[name]()
+                elapsed = time.perf_counter() - started
+
+                sent, failed, shard_db_seconds = task_totals("db.sqlite3", tasks_before)
+                report = Report(
+                    scenario=name,
+                    users=users,
+                    sent=sent,
+                    failed=failed,
+                    seconds=elapsed,
+                    p50=recorder.quantile(0.5),
+                    p99=recorder.quantile(0.99),
+                    db_seconds=sum(metrics.db_latency.sums.values()) + shard_db_seconds,
+                    rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                )
+                print(report.line(), flush=True)
+                reports.append(report)
+    finally:
+        await bot.session.close()
+        await server.stop()
+    return reports
+
+
+def main() -> None:
+    args = parse_args()
+    workdir = prepare_environment(args)
+    print(f"База бенчмарка: {workdir}/db.sqlite3", flush=True)
+
+    reports = asyncio.run(run(args))
+
+    if args.output:
+        with open(os.path.join(ROOT, args.output) if not os.path.isabs(args.output) else args.output, "a") as file:
+            file.write(f"# {datetime.now().isoformat(timespec='seconds')} latency={args.latency} "
+                       f"flood={args.flood_rate} forbidden={args.forbidden_rate}\n")
+            file.writelines(report.line() + "\n" for report in reports)
+
+
+if __name__ == "__main__":
+    main()
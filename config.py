@@ -1 +1,98 @@
-ADMINS_IDS = [5381412319, 6284122542]
\ No newline at end of file
+import os
+
+ADMINS_IDS = [5381412319, 6284122542]
+
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", 20))
+BROADCAST_GLOBAL_RATE = float(os.getenv("BROADCAST_GLOBAL_RATE", 25))
+BROADCAST_CHAT_RATE = float(os.getenv("BROADCAST_CHAT_RATE", 1))
+BROADCAST_GROUP_RATE = float(os.getenv("BROADCAST_GROUP_RATE", 20 / 60))
+
+BROADCAST_RETRY_BASE_DELAY = float(os.getenv("BROADCAST_RETRY_BASE_DELAY", 1))
+BROADCAST_RETRY_MAX_DELAY = float(os.getenv("BROADCAST_RETRY_MAX_DELAY", 60))
+BROADCAST_RETRY_BUDGETS = {
+    "flood": int(os.getenv("BROADCAST_RETRY_FLOOD", 5)),
+    "network": int(os.getenv("BROADCAST_RETRY_NETWORK", 3)),
+    "server": int(os.getenv("BROADCAST_RETRY_SERVER", 3)),
+}
+
+JOURNAL_BATCH_SIZE = int(os.getenv("JOURNAL_BATCH_SIZE", 500))
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", 2))
+# Ошибки доставки завершённых рассылок храним для разбора, успешные удаляются сразу после итогов.
+DELIVERY_RETENTION_DAYS = int(os.getenv("DELIVERY_RETENTION_DAYS", 7))
+
+USERS_CHUNK_SIZE = int(os.getenv("USERS_CHUNK_SIZE", 1000))
+
+REGISTRATION_BATCH_SIZE = int(os.getenv("REGISTRATION_BATCH_SIZE", 200))
+REGISTRATION_FLUSH_INTERVAL = float(os.getenv("REGISTRATION_FLUSH_INTERVAL", 1))
+
+SCHEDULE_MISFIRE_GRACE = int(os.getenv("SCHEDULE_MISFIRE_GRACE", 3600))
+
+BROADCAST_SHARDS = int(os.getenv("BROADCAST_SHARDS", 1))
+BROADCAST_LOCAL_SHARDS = int(os.getenv("BROADCAST_LOCAL_SHARDS", BROADCAST_SHARDS))
+RATE_LEASE_SIZE = int(os.getenv("RATE_LEASE_SIZE", 5))
+SHARD_HEARTBEAT = float(os.getenv("SHARD_HEARTBEAT", 10))
+SHARD_LEASE_TIMEOUT = float(os.getenv("SHARD_LEASE_TIMEOUT", 60))
+SHARD_MAX_ATTEMPTS = int(os.getenv("SHARD_MAX_ATTEMPTS", 3))
+SHARD_POLL_INTERVAL = float(os.getenv("SHARD_POLL_INTERVAL", 2))
+TASK_HEARTBEAT = float(os.getenv("TASK_HEARTBEAT", 10))
+TASK_LEASE_TIMEOUT = float(os.getenv("TASK_LEASE_TIMEOUT", 60))
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", 5))
+PROGRESS_TOP_ERRORS = int(os.getenv("PROGRESS_TOP_ERRORS", 5))
+
+UPDATES_MODE = os.getenv("UPDATES_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 16))
+WEBHOOK_REGISTER = os.getenv("WEBHOOK_REGISTER", "1") == "1"
+
+KEYBOARD_CACHE_SIZE = int(os.getenv("KEYBOARD_CACHE_SIZE", 256))
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 0 — сервер метрик выключен; 9100 занят node_exporter, берите свободный порт.
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
+BOT_API_URL = os.getenv("BOT_API_URL", "")
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", BROADCAST_WORKERS + 10))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", 60))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", 3600))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 60))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_ORJSON = os.getenv("HTTP_ORJSON", "1") == "1"
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///db.sqlite3")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -64 * 1024))
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+
+ADMINS_CACHE_TTL = float(os.getenv("ADMINS_CACHE_TTL", 60))
+
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", 3600))
+CHAT_CACHE_MAX_STALE = float(os.getenv("CHAT_CACHE_MAX_STALE", 7 * 24 * 3600))
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", 10_000))
+CHAT_CACHE_CONCURRENCY = int(os.getenv("CHAT_CACHE_CONCURRENCY", 5))
+
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", 0.5))
+FSM_BATCH_SIZE = int(os.getenv("FSM_BATCH_SIZE", 100))
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", 5))
+# Кэш и отложенная запись FSM годятся для одного процесса; webhook за балансировщиком — несколько процессов.
+FSM_SHARED = os.getenv("FSM_SHARED", "1" if UPDATES_MODE == "webhook" else "0") == "1"
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", 10_000))
+
+BROADCAST_TEMPLATE_MODE = os.getenv("BROADCAST_TEMPLATE_MODE", "1") == "1"
+
+CAMPAIGN_MAX_ACTIVE = int(os.getenv("CAMPAIGN_MAX_ACTIVE", 2))
+CAMPAIGN_WEIGHTS = {
+    "urgent": float(os.getenv("CAMPAIGN_WEIGHT_URGENT", 4)),
+    "bulk": float(os.getenv("CAMPAIGN_WEIGHT_BULK", 1)),
+}
+CAMPAIGN_PREEMPT = os.getenv("CAMPAIGN_PREEMPT", "1") == "1"
@@ -1,8 +1,60 @@
-from sqlalchemy import ForeignKey, String, BigInteger, Integer, Boolean, LargeBinary
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, String, BigInteger, Integer, Float, Boolean, LargeBinary, DateTime, Index, JSON, inspect, text, event, true
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import Mapped, mapped_column, DeclarativeBase, relationship
-from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncEngine, async_sessionmaker, create_async_engine
+
+from config import (
+    DATABASE_URL,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_MMAP_SIZE,
+    SQLITE_CACHE_SIZE,
+    SQLITE_BUSY_TIMEOUT,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE
+)
+
+def sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    # WAL позволяет рассылке читать пользователей, пока регистрация пишет новых.
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.close()
+
+def create_engine(url: str = DATABASE_URL) -> AsyncEngine:
+    backend = make_url(url).get_backend_name()
+
+    if backend == "sqlite":
+        engine = create_async_engine(url=url, echo=False)
+        event.listen(engine.sync_engine, "connect", sqlite_pragmas)
+        return engine
+
+    if backend == "postgresql":
+        return create_async_engine(
+            url=url,
+            echo=False,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True
+        )
+
+    raise ValueError(f"Неподдерживаемая база данных: {backend}. Используйте sqlite+aiosqlite или postgresql+asyncpg.")
 
-engine = create_async_engine(url="sqlite+aiosqlite:///db.sqlite3", echo=False)
+engine = create_engine()
+
+if engine.dialect.name == "postgresql":
+    from sqlalchemy.dialects.postgresql import insert
+else:
+    from sqlalchemy.dialects.sqlite import insert
 
 async_session = async_sessionmaker(engine)
 
@@ -11,28 +63,149 @@ class Base(AsyncAttrs, DeclarativeBase):
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_active', 'is_active', 'id'),
+        Index('ix_users_chat_type', 'is_active', 'chat_type', 'id'),
+        Index('ix_users_language', 'is_active', 'language_code', 'id'),
+        Index('ix_users_clients', 'is_active', 'is_client', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    tg_id = mapped_column(BigInteger)
-    is_client: Mapped[int] = mapped_column(Boolean, default=False)
+    tg_id = mapped_column(BigInteger, index=True, unique=True)
+    is_client: Mapped[int] = mapped_column(Boolean, default=False, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=True, default=datetime.now, index=True)
+    is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True, server_default=true())
+    inactive_reason: Mapped[str] = mapped_column(String, nullable=True)
+    inactive_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    chat_type: Mapped[str] = mapped_column(String, nullable=True)
+    language_code: Mapped[str] = mapped_column(String, nullable=True)
+
+class UserTag(Base):
+    __tablename__ = 'user_tags'
+
+    tag: Mapped[str] = mapped_column(String, primary_key=True)
+    tg_id = mapped_column(BigInteger, primary_key=True)
 
 class Admin(Base):
     __tablename__ = "admins"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    tg_id = mapped_column(BigInteger)
+    tg_id = mapped_column(BigInteger, index=True, unique=True)
 
 class Task(Base):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        Index('ix_tasks_pending', 'is_executed', 'run_at'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    run_at: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    run_at: Mapped[str] = mapped_column(String, nullable=False)
     news_text: Mapped[str] = mapped_column(String, nullable=False)
     button_text: Mapped[str] = mapped_column(String, nullable=True)
     button_url: Mapped[str] = mapped_column(String, nullable=True)
     file_data: Mapped[str] = mapped_column(String, nullable=True)
+    media_type: Mapped[str] = mapped_column(String, nullable=True)
     is_executed: Mapped[bool] = mapped_column(Boolean, default=False)
+    author_id = mapped_column(BigInteger, nullable=True)
+    started_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime] = mapped_column(DateTime, nullable=True, index=True)
+    sent_count: Mapped[int] = mapped_column(Integer, nullable=True)
+    failed_count: Mapped[int] = mapped_column(Integer, nullable=True)
+    segment = mapped_column(JSON, nullable=True)
+    album = mapped_column(JSON, nullable=True)
+    template_chat_id = mapped_column(BigInteger, nullable=True)
+    template_message_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    priority: Mapped[str] = mapped_column(String, nullable=False, default="bulk", server_default="bulk")
+    # Процесс, который ведёт рассылку; чужую задачу можно забрать, только когда её heartbeat протух.
+    owner: Mapped[str] = mapped_column(String, nullable=True)
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+
+class Delivery(Base):
+    __tablename__ = 'deliveries'
+
+    task_id: Mapped[int] = mapped_column(ForeignKey('tasks.id', ondelete='CASCADE'), primary_key=True)
+    chat_id = mapped_column(BigInteger, primary_key=True)
+    status: Mapped[str] = mapped_column(String, nullable=False)
+    error: Mapped[str] = mapped_column(String, nullable=True)
+
+class Stat(Base):
+    __tablename__ = 'stats'
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, default=0)
+
+class MediaFile(Base):
+    __tablename__ = 'media_files'
+
+    path: Mapped[str] = mapped_column(String, primary_key=True)
+    media_type: Mapped[str] = mapped_column(String, nullable=False)
+    file_id: Mapped[str] = mapped_column(String, nullable=False)
+
+class RateLease(Base):
+    __tablename__ = 'rate_leases'
+
+    window = mapped_column(BigInteger, primary_key=True)
+    used: Mapped[int] = mapped_column(Integer, default=0)
+
+class ShardLease(Base):
+    __tablename__ = 'shard_leases'
+    __table_args__ = (
+        Index('ix_shard_leases_status', 'status', 'task_id'),
+    )
+
+    task_id: Mapped[int] = mapped_column(ForeignKey('tasks.id', ondelete='CASCADE'), primary_key=True)
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+    # pending -> running -> done | failed; running с протухшим heartbeat снова можно забрать.
+    status: Mapped[str] = mapped_column(String, nullable=False, default="pending")
+    owner: Mapped[str] = mapped_column(String, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    error: Mapped[str] = mapped_column(String, nullable=True)
+    # Время запросов к базе в процессе шарда: в метриках главного процесса его нет.
+    db_seconds: Mapped[float] = mapped_column(Float, nullable=True)
+
+class FsmRecord(Base):
+    __tablename__ = 'fsm_states'
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    state: Mapped[str] = mapped_column(String, nullable=True)
+    # none_as_null: пустые данные хранятся как NULL, чтобы сброшенную строку можно было найти и удалить.
+    data = mapped_column(JSON(none_as_null=True), nullable=True)
+    # Версия data: update_data из разных процессов пишет, только если data не менялась с чтения.
+    version: Mapped[int] = mapped_column(Integer, nullable=True, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=True, default=datetime.now)
+
+def remove_duplicate_users(connection) -> None:
+    # Уникальный индекс на tg_id не создастся, пока в таблице есть дубликаты.
+    inspector = inspect(connection)
+    for table in (User.__tablename__, Admin.__tablename__):
+        if inspector.has_table(table):
+            connection.execute(text(
+                f"DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY tg_id)"
+            ))
+
+def sync_schema(connection) -> None:
+    # create_all не трогает уже существующие таблицы, поэтому новые колонки и индексы добавляем сами.
+    Base.metadata.create_all(connection)
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+def backfill_chat_types(connection) -> None:
+    # До появления chat_type тип чата можно восстановить только по знаку id.
+    connection.execute(text(
+        "UPDATE users SET chat_type = CASE WHEN tg_id > 0 THEN 'private' ELSE 'group' END WHERE chat_type IS NULL"
+    ))
 
 async def async_main():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(remove_duplicate_users)
+        await conn.run_sync(sync_schema)
+        await conn.run_sync(backfill_chat_types)
\ No newline at end of file
@@ -1,22 +1,194 @@
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Optional, AsyncIterator
 
-from database.models import async_session
-from database.models import User, Admin, Task
-from sqlalchemy import select, update, delete, desc
+from database.models import async_session, insert
+from database.models import User, UserTag, Admin, Task, Delivery, Stat, RateLease, ShardLease, MediaFile, FsmRecord
+from sqlalchemy import select, update, delete, desc, exists, func, bindparam, or_, and_
 
-async def set_user(tg_id):
+from helpers.metrics import timed, db_latency
+
+from config import USERS_CHUNK_SIZE
+
+@timed
+async def set_user(tg_id, chat_type: str = "private", language_code: str | None = None):
+    await set_users([{"tg_id": tg_id, "chat_type": chat_type, "language_code": language_code}])
+
+@timed
+async def set_users(users: list[dict]):
+    if not users:
+        return
+
+    tg_ids = [user["tg_id"] for user in users]
     async with async_session() as session:
         async with session.begin():
-            user = await session.scalar(select(User).where(User.tg_id == tg_id))
-            if not user:
-                user = User(tg_id=tg_id)
-                session.add(user)
-            await session.commit()
+            now = datetime.now()
+            stmt = insert(User).values([
+                {
+                    "tg_id": user["tg_id"],
+                    "is_client": False,
+                    "created_at": now,
+                    "chat_type": user.get("chat_type"),
+                    "language_code": user.get("language_code"),
+                } for user in users
+            ]).on_conflict_do_nothing(index_elements=[User.tg_id])
+            result = await session.execute(stmt)
+            if result.rowcount:
+                await increment_stat(session, "users", result.rowcount)
+
+            languages = [
+                {"b_tg_id": user["tg_id"], "b_language": user["language_code"]}
+                for user in users if user.get("language_code")
+            ]
+            if languages:
+                connection = await session.connection()
+                await connection.execute(
+                    update(User)
+                    .where(User.tg_id == bindparam("b_tg_id"), User.language_code.is_distinct_from(bindparam("b_language")))
+                    .values(language_code=bindparam("b_language")),
+                    languages
+                )
+
+            # Повторный /start или возвращение в группу снова делает чат адресатом рассылок.
+            await session.execute(
+                update(User)
+                .where(User.tg_id.in_(tg_ids), User.is_active == False)
+                .values(is_active=True, inactive_reason=None, inactive_at=None)
+            )
+
+@timed
+async def deactivate_users(reasons: dict[int, str]) -> int:
+    if not reasons:
+        return 0
+
+    by_reason: dict[str, list[int]] = {}
+    for tg_id, reason in reasons.items():
+        by_reason.setdefault(reason, []).append(tg_id)
+
+    deactivated = 0
+    async with async_session() as session:
+        async with session.begin():
+            now = datetime.now()
+            for reason, tg_ids in by_reason.items():
+                result = await session.execute(
+                    update(User)
+                    .where(User.tg_id.in_(tg_ids), User.is_active == True)
+                    .values(is_active=False, inactive_reason=reason, inactive_at=now)
+                )
+                deactivated += result.rowcount
+    return deactivated
+
+async def increment_stat(session, name: str, value: int = 1):
+    await session.execute(update(Stat).where(Stat.name == name).values(value=Stat.value + value))
+
+@timed
+async def init_stats():
+    async with async_session() as session:
+        async with session.begin():
+            if await session.scalar(select(func.count()).select_from(Stat)):
+                return
+
+            users = await session.scalar(select(func.count()).select_from(User))
+            clients = await session.scalar(select(func.count()).select_from(User).where(User.is_client == 1))
+            session.add_all([Stat(name="users", value=users), Stat(name="clients", value=clients)])
+
+@timed
+async def get_statistics() -> dict:
+    async with async_session() as session:
+        async with session.begin():
+            stats = dict((await session.execute(select(Stat.name, Stat.value))).all())
+
+            today = datetime.combine(datetime.now().date(), datetime.min.time())
+            new_today = await session.scalar(
+                select(func.count()).select_from(User).where(User.created_at >= today)
+            )
+            new_week = await session.scalar(
+                select(func.count()).select_from(User).where(User.created_at >= today - timedelta(days=6))
+            )
+            inactive = dict((await session.execute(
+                select(User.inactive_reason, func.count()).where(User.is_active == False).group_by(User.inactive_reason)
+            )).all())
+            pruned_week = await session.scalar(
+                select(func.count()).select_from(User).where(
+                    User.is_active == False,
+                    User.inactive_at >= today - timedelta(days=6)
+                )
+            )
+
+            last_task = await session.scalar(
+                select(Task).where(Task.finished_at.is_not(None)).order_by(desc(Task.finished_at)).limit(1)
+            )
+            throughput = None
+            if last_task and last_task.started_at and last_task.sent_count:
+                duration = (last_task.finished_at - last_task.started_at).total_seconds()
+                throughput = last_task.sent_count / max(duration, 1)
+
+            return {
+                "users": stats.get("users", 0),
+                "clients": stats.get("clients", 0),
+                "new_today": new_today,
+                "new_week": new_week,
+                "inactive": sum(inactive.values()),
+                "inactive_reasons": inactive,
+                "pruned_week": pruned_week,
+                "last_throughput": throughput,
+            }
+
+def segment_filter(query, segment: dict | None):
+    # Каждый признак сегмента — равенство по колонке из составного индекса (is_active, <признак>, id)
+    # или членство в user_tags, поэтому выборка не сканирует всю таблицу.
+    if not segment:
+        return query
+    if segment.get("clients"):
+        query = query.where(User.is_client == 1)
+    if segment.get("chat_type"):
+        query = query.where(User.chat_type == segment["chat_type"])
+    if segment.get("language"):
+        query = query.where(User.language_code == segment["language"])
+    if segment.get("joined_days"):
+        query = query.where(User.created_at >= datetime.now() - timedelta(days=segment["joined_days"]))
+    if segment.get("tag"):
+        query = query.where(User.tg_id.in_(select(UserTag.tg_id).where(UserTag.tag == segment["tag"])))
+    return query
+
+@timed
+async def count_users(segment: dict | None = None) -> int:
+    async with async_session() as session:
+        async with session.begin():
+            query = segment_filter(select(func.count()).select_from(User).where(User.is_active == True), segment)
+            return await session.scalar(query)
+
+@timed
+async def tag_users(tag: str, tg_ids: list[int]) -> int:
+    if not tg_ids:
+        return 0
+
+    async with async_session() as session:
+        async with session.begin():
+            stmt = insert(UserTag).values([{"tag": tag, "tg_id": tg_id} for tg_id in dict.fromkeys(tg_ids)])
+            result = await session.execute(stmt.on_conflict_do_nothing(index_elements=[UserTag.tag, UserTag.tg_id]))
+            return result.rowcount
+
+@timed
+async def untag_users(tag: str, tg_ids: list[int]) -> int:
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(delete(UserTag).where(UserTag.tag == tag, UserTag.tg_id.in_(tg_ids)))
+            return result.rowcount
 
-async def get_all_users(only_clients: bool = False):
+@timed
+async def get_tags() -> dict[str, int]:
     async with async_session() as session:
         async with session.begin():
-            query = select(User.tg_id)
+            result = await session.execute(
+                select(UserTag.tag, func.count()).group_by(UserTag.tag).order_by(UserTag.tag)
+            )
+            return dict(result.all())
+
+@timed
+async def get_all_users(only_clients: bool = False, segment: dict | None = None):
+    async with async_session() as session:
+        async with session.begin():
+            query = segment_filter(select(User.tg_id).where(User.is_active == True), segment)
             if only_clients:
                 query = query.where(User.is_client == 1)
 
@@ -24,6 +196,43 @@ async def get_all_users(only_clients: bool = False):
             user_ids = result.scalars().all()
             return user_ids
 
+async def iter_users(only_clients: bool = False,
+                     chunk_size: int = USERS_CHUNK_SIZE,
+                     exclude_task_id: int | None = None,
+                     shard: tuple[int, int] | None = None,
+                     segment: dict | None = None) -> AsyncIterator[list[int]]:
+    last_id = 0
+    while True:
+        async with async_session() as session:
+            query = (
+                select(User.id, User.tg_id)
+                .where(User.is_active == True, User.id > last_id)
+                .order_by(User.id)
+                .limit(chunk_size)
+            )
+            query = segment_filter(query, segment)
+            if only_clients:
+                query = query.where(User.is_client == 1)
+            if exclude_task_id is not None:
+                query = query.where(~exists().where(
+                    Delivery.task_id == exclude_task_id,
+                    Delivery.chat_id == User.tg_id
+                ))
+            if shard is not None:
+                index, count = shard
+                query = query.where(User.id % count == index)
+
+            with db_latency.time("iter_users"):
+                rows = (await session.execute(query)).all()
+
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield [row.tg_id for row in rows]
+        if len(rows) < chunk_size:
+            return
+
+@timed
 async def mark_user_as_client(tg_id: int):
     async with async_session() as session:
         async with session.begin():
@@ -31,15 +240,70 @@ async def mark_user_as_client(tg_id: int):
             result = await session.execute(stmt)
             user = result.scalar_one_or_none()
 
-            if user:
+            if user and not user.is_client:
                 user.is_client = True
                 session.add(user)
+                await increment_stat(session, "clients")
+
+@timed
+async def get_admin_ids() -> list[int]:
+    async with async_session() as session:
+        async with session.begin():
+            return list((await session.scalars(select(Admin.tg_id))).all())
+
+@timed
+async def add_admins(tg_ids: list[int]) -> int:
+    if not tg_ids:
+        return 0
+
+    async with async_session() as session:
+        async with session.begin():
+            stmt = insert(Admin).values([{"tg_id": tg_id} for tg_id in tg_ids])
+            result = await session.execute(stmt.on_conflict_do_nothing(index_elements=[Admin.tg_id]))
+            return result.rowcount
+
+@timed
+async def remove_admin(tg_id: int) -> bool:
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(delete(Admin).where(Admin.tg_id == tg_id))
+            return bool(result.rowcount)
 
+def task_to_dict(task: Task) -> dict:
+    return {
+        "id": task.id,
+        "run_at": task.run_at,
+        "news_text": task.news_text,
+        "button_text": task.button_text,
+        "button_url": task.button_url,
+        "file_data": task.file_data,
+        "media_type": task.media_type,
+        "is_executed": task.is_executed,
+        "author_id": task.author_id,
+        "started_at": task.started_at,
+        "finished_at": task.finished_at,
+        "sent_count": task.sent_count,
+        "failed_count": task.failed_count,
+        "segment": task.segment,
+        "album": task.album,
+        "template_chat_id": task.template_chat_id,
+        "template_message_id": task.template_message_id,
+        "priority": task.priority or "bulk",
+    }
+
+@timed
 async def add_task(run_at: str,
                    news_text: str,
                    button_text: str | None = None,
                    button_url: str | None = None,
-                   file_data: Optional[str] | None = None):
+                   file_data: Optional[str] | None = None,
+                   media_type: str | None = None,
+                   author_id: int | None = None,
+                   segment: dict | None = None,
+                   album: list[dict] | None = None,
+                   template_chat_id: int | None = None,
+                   template_message_id: int | None = None,
+                   priority: str = "bulk") -> int:
     async with async_session() as session:
         async with session.begin():
             task = Task(
@@ -47,35 +311,347 @@ async def add_task(run_at: str,
                 news_text=news_text,
                 button_text=button_text,
                 button_url=button_url,
-                file_data=file_data
+                file_data=file_data,
+                media_type=media_type,
+                author_id=author_id,
+                segment=segment or None,
+                album=album or None,
+                template_chat_id=template_chat_id,
+                template_message_id=template_message_id,
+                priority=priority
             )
             session.add(task)
+            await session.flush()
+            return task.id
 
-async def get_task(run_at: str):
+@timed
+async def get_task(task_id: int):
     async with async_session() as session:
         async with session.begin():
-            stmt = select(Task).where(Task.run_at == run_at)
-            result = await session.execute(stmt)
-            task = result.scalar_one_or_none()
+            task = await session.get(Task, task_id)
 
             if task:
-                return {
-                    "id": task.id,
-                    "run_at": task.run_at,
-                    "news_text": task.news_text,
-                    "button_text": task.button_text,
-                    "button_url": task.button_url,
-                    "file_data": task.file_data,
-                    "is_executed": task.is_executed,
-                }
+                return task_to_dict(task)
             return None
 
+@timed
+async def claim_task(task_id: int, owner: str, lease_timeout: float) -> bool:
+    # Задачу ведёт один процесс: иначе каждая реплика бота разослала бы её заново.
+    now = datetime.now()
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                update(Task)
+                .where(Task.id == task_id, Task.is_executed == False, or_(
+                    Task.owner.is_(None),
+                    Task.heartbeat_at < now - timedelta(seconds=lease_timeout)
+                ))
+                .values(owner=owner, heartbeat_at=now, started_at=func.coalesce(Task.started_at, now))
+            )
+            return bool(result.rowcount)
+
+@timed
+async def heartbeat_task(task_id: int, owner: str):
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                update(Task)
+                .where(Task.id == task_id, Task.owner == owner, Task.is_executed == False)
+                .values(heartbeat_at=datetime.now())
+            )
+
+@timed
+async def release_task(task_id: int, owner: str):
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                update(Task).where(Task.id == task_id, Task.owner == owner).values(owner=None, heartbeat_at=None)
+            )
+
+@timed
+async def get_stale_tasks(lease_timeout: float) -> list[int]:
+    # Владелец пропал, не отпустив задачу: процесс упал посреди рассылки.
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                select(Task.id).where(
+                    Task.is_executed == False,
+                    Task.owner.is_not(None),
+                    Task.heartbeat_at < datetime.now() - timedelta(seconds=lease_timeout)
+                )
+            )
+            return list(result.scalars().all())
+
+@timed
+async def mark_task_executed(task_id: int, sent: int = 0, failed: int = 0) -> bool:
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(update(Task).where(Task.id == task_id, Task.is_executed == False).values(
+                is_executed=True,
+                finished_at=datetime.now(),
+                sent_count=sent,
+                failed_count=failed
+            ))
+            return bool(result.rowcount)
+
+@timed
+async def get_pending_tasks():
+    async with async_session() as session:
+        async with session.begin():
+            stmt = select(Task).where(Task.is_executed == False).order_by(Task.run_at)
+            result = await session.execute(stmt)
+            return [task_to_dict(task) for task in result.scalars().all()]
+
+@timed
 async def remove_task(task_id: int):
     async with async_session() as session:
         async with session.begin():
+            await session.execute(delete(Delivery).where(Delivery.task_id == task_id))
+            await session.execute(delete(ShardLease).where(ShardLease.task_id == task_id))
             stmt = select(Task).where(Task.id == task_id)
             result = await session.execute(stmt)
             task = result.scalar_one_or_none()
 
             if task:
-                await session.delete(task)
\ No newline at end of file
+                await session.delete(task)
+
+@timed
+async def save_deliveries(rows: list[dict]):
+    async with async_session() as session:
+        async with session.begin():
+            stmt = insert(Delivery)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Delivery.task_id, Delivery.chat_id],
+                set_={"status": stmt.excluded.status, "error": stmt.excluded.error}
+            )
+            await session.execute(stmt, rows)
+
+@timed
+async def get_delivery_counts(task_id: int) -> dict[str, int]:
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                select(Delivery.status, func.count()).where(Delivery.task_id == task_id).group_by(Delivery.status)
+            )
+            return dict(result.all())
+
+@timed
+async def get_delivery_errors(task_id: int) -> list[tuple[int, str, str | None]]:
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                select(Delivery.chat_id, Delivery.status, Delivery.error)
+                .where(Delivery.task_id == task_id, Delivery.status != "sent")
+                .order_by(Delivery.chat_id)
+            )
+            return [tuple(row) for row in result.all()]
+
+@timed
+async def prune_deliveries(task_id: int, retention: timedelta) -> int:
+    # Журнал нужен, только пока рассылку можно возобновить; иначе deliveries растёт на всю аудиторию каждый раз.
+    async with async_session() as session:
+        async with session.begin():
+            sent = await session.execute(
+                delete(Delivery).where(Delivery.task_id == task_id, Delivery.status == "sent")
+            )
+            expired = await session.execute(
+                delete(Delivery).where(Delivery.task_id.in_(
+                    select(Task.id).where(Task.is_executed == True, Task.finished_at < datetime.now() - retention)
+                ))
+            )
+            return sent.rowcount + expired.rowcount
+
+@timed
+async def claim_rate_tokens(window: int, count: int, limit: int) -> bool:
+    async with async_session() as session:
+        async with session.begin():
+            created = await session.execute(
+                insert(RateLease).values(window=window, used=0).on_conflict_do_nothing()
+            )
+            if created.rowcount:
+                await session.execute(delete(RateLease).where(RateLease.window < window - 60))
+
+            result = await session.execute(
+                update(RateLease)
+                .where(RateLease.window == window, RateLease.used + count <= limit)
+                .values(used=RateLease.used + count)
+            )
+            return bool(result.rowcount)
+
+@timed
+async def create_shards(task_id: int, count: int):
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                insert(ShardLease)
+                .values([{"task_id": task_id, "shard": shard, "count": count, "status": "pending", "attempts": 0}
+                         for shard in range(count)])
+                .on_conflict_do_nothing()
+            )
+
+@timed
+async def claim_shard(owner: str,
+                      lease_timeout: float,
+                      max_attempts: int,
+                      task_id: int | None = None) -> tuple[int, int, int] | None:
+    now = datetime.now()
+    stale_before = now - timedelta(seconds=lease_timeout)
+    stale = and_(ShardLease.status == "running", ShardLease.heartbeat_at < stale_before)
+
+    async with async_session() as session:
+        async with session.begin():
+            # Владелец протухшей аренды исчерпал попытки — шард провален, а не переигрывается вечно.
+            await session.execute(
+                update(ShardLease)
+                .where(stale, ShardLease.attempts >= max_attempts)
+                .values(status="failed", error="аренда шарда истекла")
+            )
+
+            query = select(ShardLease).where(or_(ShardLease.status == "pending", stale))
+            if task_id is not None:
+                query = query.where(ShardLease.task_id == task_id)
+            candidates = (await session.execute(
+                query.order_by(ShardLease.task_id, ShardLease.shard).limit(5)
+            )).scalars().all()
+
+            for lease in candidates:
+                # attempts служит версией строки: забрать шард сможет только один претендент.
+                result = await session.execute(
+                    update(ShardLease)
+                    .where(ShardLease.task_id == lease.task_id,
+                           ShardLease.shard == lease.shard,
+                           ShardLease.status == lease.status,
+                           ShardLease.attempts == lease.attempts)
+                    .values(status="running", owner=owner, attempts=lease.attempts + 1, heartbeat_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount:
+                    return lease.task_id, lease.shard, lease.count
+            return None
+
+@timed
+async def heartbeat_shard(task_id: int, shard: int, owner: str):
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                update(ShardLease)
+                .where(ShardLease.task_id == task_id, ShardLease.shard == shard,
+                       ShardLease.owner == owner, ShardLease.status == "running")
+                .values(heartbeat_at=datetime.now())
+            )
+
+@timed
+async def finish_shard(task_id: int, shard: int, owner: str, db_seconds: float | None = None):
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                update(ShardLease)
+                .where(ShardLease.task_id == task_id, ShardLease.shard == shard, ShardLease.owner == owner)
+                .values(status="done", error=None, db_seconds=db_seconds)
+            )
+
+@timed
+async def release_shards(owner: str, error: str, max_attempts: int):
+    async with async_session() as session:
+        async with session.begin():
+            running = and_(ShardLease.owner == owner, ShardLease.status == "running")
+            await session.execute(
+                update(ShardLease)
+                .where(running, ShardLease.attempts >= max_attempts)
+                .values(status="failed", error=error)
+            )
+            await session.execute(
+                update(ShardLease)
+                .where(running)
+                .values(status="pending", owner=None, heartbeat_at=None, error=error)
+            )
+
+@timed
+async def get_shards(task_id: int) -> list[dict]:
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                select(ShardLease).where(ShardLease.task_id == task_id).order_by(ShardLease.shard)
+            )
+            return [
+                {"shard": lease.shard, "status": lease.status, "heartbeat_at": lease.heartbeat_at,
+                 "error": lease.error, "db_seconds": lease.db_seconds}
+                for lease in result.scalars().all()
+            ]
+
+@timed
+async def get_media_file_id(path: str) -> str | None:
+    async with async_session() as session:
+        async with session.begin():
+            return await session.scalar(select(MediaFile.file_id).where(MediaFile.path == path))
+
+@timed
+async def save_media_file_id(path: str, media_type: str, file_id: str):
+    async with async_session() as session:
+        async with session.begin():
+            stmt = insert(MediaFile).values(path=path, media_type=media_type, file_id=file_id)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[MediaFile.path],
+                set_={"media_type": stmt.excluded.media_type, "file_id": stmt.excluded.file_id}
+            )
+            await session.execute(stmt)
+
+@timed
+async def get_fsm_record(key: str) -> tuple[str | None, dict, int] | None:
+    async with async_session() as session:
+        async with session.begin():
+            record = await session.get(FsmRecord, key)
+            if record is None:
+                return None
+            return record.state, record.data or {}, record.version or 0
+
+def _drop_empty_fsm_records(keys: list[str]):
+    # Сброшенное состояние (state и data пусты) не хранится.
+    return delete(FsmRecord).where(FsmRecord.key.in_(keys), FsmRecord.state.is_(None), FsmRecord.data.is_(None))
+
+@timed
+async def save_fsm_records(records: dict[str, dict]):
+    """Пишет только переданные колонки (state и/или data), строку перед записью не читает."""
+    if not records:
+        return
+
+    now = datetime.now()
+    groups: dict[tuple[str, ...], list[dict]] = {}
+    for key, columns in records.items():
+        row = {"key": key, "updated_at": now, **columns}
+        if "data" in columns:
+            row["data"] = columns["data"] or None
+        groups.setdefault(tuple(sorted(columns)), []).append(row)
+
+    async with async_session() as session:
+        async with session.begin():
+            for columns, rows in groups.items():
+                stmt = insert(FsmRecord)
+                set_ = {column: stmt.excluded[column] for column in columns}
+                set_["updated_at"] = stmt.excluded.updated_at
+                if "data" in columns:
+                    set_["version"] = func.coalesce(FsmRecord.version, 0) + 1
+                stmt = stmt.on_conflict_do_update(index_elements=[FsmRecord.key], set_=set_)
+                await session.execute(stmt, rows)
+            await session.execute(_drop_empty_fsm_records(list(records)))
+
+@timed
+async def replace_fsm_data(key: str, data: dict, version: int | None) -> bool:
+    """Записывает data, только если её версия всё ещё version (None — строки не было). False — проиграли гонку."""
+    now = datetime.now()
+    async with async_session() as session:
+        async with session.begin():
+            if version is None:
+                stmt = insert(FsmRecord).values(key=key, data=data or None, version=1, updated_at=now)
+                result = await session.execute(stmt.on_conflict_do_nothing(index_elements=[FsmRecord.key]))
+            else:
+                result = await session.execute(
+                    update(FsmRecord)
+                    .where(FsmRecord.key == key, func.coalesce(FsmRecord.version, 0) == version)
+                    .values(data=data or None, version=version + 1, updated_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+            if not result.rowcount:
+                return False
+            await session.execute(_drop_empty_fsm_records([key]))
+            return True
\ No newline at end of file
@@ -1,11 +1,11 @@
 from aiogram.filters import BaseFilter
-from aiogram.types.message import Message
+from aiogram.types import Message, CallbackQuery
 
-from config import ADMINS_IDS
+from helpers.admins import admin_registry
 
 class IsAdmin(BaseFilter):
     async def __call__(self,
-                       message: Message,
+                       event: Message | CallbackQuery,
                        *args,
                        **kwargs) -> bool:
-        return message.from_user.id in ADMINS_IDS
\ No newline at end of file
+        return event.from_user is not None and admin_registry.is_admin(event.from_user.id)
\ No newline at end of file
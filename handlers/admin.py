@@ -1,115 +1,341 @@
-from datetime import datetime, time
+import asyncio
+import logging
+from datetime import datetime, date, time, timedelta
+from html import escape
+from typing import Awaitable, Callable
 
-from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove, InputFile
-from aiogram.filters.command import Command
-from aiogram.fsm.context import FSMContext
+from aiogram import Bot, Router, F
 from aiogram.exceptions import TelegramBadRequest
-
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove, InputFile, InlineKeyboardMarkup
+from aiogram.filters.command import Command, CommandObject
+from aiogram.fsm.context import FSMContext
 
 from filters.admin_filter import IsAdmin
 from states.admin import AdminStates
 from keyboards.admin import InlineKeyboardsControl, ReplyKeyboardsControl
-
-from database.requests import get_all_users, add_task, remove_task, get_task
-
-from config import ADMINS_IDS
+from helpers.broadcast import BroadcastResult, Broadcaster, ResultFunc, SendFunc, broadcaster, deliver
+from helpers.senders import task_sender, ALBUM_BUTTON_TEXT
+from helpers.media import send_media, send_album, album_accepts, ALBUM_LIMIT
+from helpers import metrics
+from helpers.sharding import LeasedRateLimiter, make_owner, run_sharded
+from helpers.progress import ProgressReporter, ShardedProgressReporter
+from helpers.campaigns import campaign_scheduler
+from helpers.apscheduler_message import scheduler, get_bot
+from helpers.admins import admin_registry
+from helpers.chats import chat_profiles
+from helpers.preflight import estimate, format_duration
+from helpers.fsm_storage import modify_data
+
+from database.requests import (
+    add_task,
+    get_task,
+    claim_task,
+    heartbeat_task,
+    release_task,
+    get_stale_tasks,
+    mark_task_executed,
+    prune_deliveries,
+    get_statistics,
+    get_pending_tasks,
+    count_users,
+    get_tags,
+    tag_users,
+    untag_users
+)
+
+from config import (
+    SCHEDULE_MISFIRE_GRACE,
+    BROADCAST_SHARDS,
+    BROADCAST_TEMPLATE_MODE,
+    DELIVERY_RETENTION_DAYS,
+    TASK_HEARTBEAT,
+    TASK_LEASE_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# Имя процесса в tasks.owner.
+TASK_OWNER = make_owner()
 
 admin = Router()
+# Весь роутер только для админов: проверка — поиск в закэшированном frozenset.
+admin.message.filter(IsAdmin())
+admin.callback_query.filter(IsAdmin())
 inline_keyboards = InlineKeyboardsControl()
 reply_keyboards = ReplyKeyboardsControl()
-scheduler = AsyncIOScheduler()
-
-async def scheduled_send(message: Message,
-                         news_text: str,
-                         chats: list,
-                         task_id: int,
-                         button_text: str | None = None,
-                         button_url: str | None = None,
-                         ) -> None:
-
-    reply_markup = None
-    if button_text and button_url:
-        reply_markup = await inline_keyboards.create_keyboards([
-            {"text": button_text, "url": button_url}
-        ])
-
-    for chat_id in chats:
+
+PANEL_KEYBOARD = inline_keyboards.build_keyboards([
+    {"text": "🧑‍✈️ Список админов", "callback": "admins_list", "url": None},
+    {"text": "🔔 Сделать объявление", "callback": "sendall", "url": None},
+    {"text": "📊 Статистика", "callback": "static", "url": None},
+    {"text": "📊 Метрики", "callback": "metrics", "url": None},
+    {"text": "📬 Очередь рассылок", "callback": "campaigns", "url": None},
+    {"text": "💳 Цены на курсы", "callback": "course_price", "url": None},
+    {"text": "❌ Закрыть меню", "callback": "close_menu", "url": None}
+])
+CHOICE_TIME_KEYBOARD = inline_keyboards.build_keyboards([
+    {"text": "Сейчас", "callback": "now", "url": None},
+    {"text": "В другое время", "callback": "any_time", "url": None},
+    {"text": "⬅️ Назад", "callback": "back_to_menu", "url": None}
+], row_width=2)
+NEWS_TYPE_KEYBOARD = inline_keyboards.build_keyboards([
+    {"text": "📝 Текстовое", "callback": "news_text", "url": None},
+    {"text": "🖼 Медийное", "callback": "news_media", "url": None},
+    {"text": "⬅️ Назад", "callback": "back_to_menu", "url": None}
+])
+BACK_TO_MENU_KEYBOARD = inline_keyboards.build_keyboard(text="⬅️ Назад", callback="back_to_menu", url=None)
+ADMINS_KEYBOARD = inline_keyboards.build_keyboards([
+    {"text": "➕ Добавить админа", "callback": "add_admin", "url": None},
+    {"text": "➖ Удалить админа", "callback": "remove_admin", "url": None},
+    {"text": "⬅️ Назад", "callback": "back_to_menu", "url": None}
+])
+PUBLISH_TEXT = "✅ Опубликовать"
+URGENT_TEXT = "⚡ Опубликовать срочно"
+DRY_RUN_TEXT = "🧪 Пробный запуск"
+# Лимит Bot API на подпись к медиа.
+CAPTION_LIMIT = 1024
+PUBLISH_REPLY_KEYBOARD = reply_keyboards.build_keyboards(row=1, texts=[PUBLISH_TEXT, URGENT_TEXT, DRY_RUN_TEXT,
+                                                                       "❌ Отменить"])
+MEDIA_DONE_KEYBOARD = inline_keyboards.build_keyboard(text="➡️ Далее", callback="media_done", url=None)
+SEGMENTS = {
+    "all": None,
+    "clients": {"clients": True},
+    "private": {"chat_type": "private"},
+    "groups": {"chat_type": "group"},
+    "new": {"joined_days": 7},
+}
+SEGMENT_TITLES = {
+    "all": "все",
+    "clients": "клиенты",
+    "private": "личные чаты",
+    "groups": "группы",
+    "new": "новые за 7 дней",
+}
+SEGMENT_KEYBOARD = inline_keyboards.build_keyboards([
+    {"text": "👥 Все", "callback": "segment:all", "url": None},
+    {"text": "🥇 Клиенты", "callback": "segment:clients", "url": None},
+    {"text": "👤 Личные чаты", "callback": "segment:private", "url": None},
+    {"text": "💬 Группы", "callback": "segment:groups", "url": None},
+    {"text": "🆕 Новые за 7 дней", "callback": "segment:new", "url": None},
+    {"text": "🌐 По языку", "callback": "segment:language", "url": None},
+    {"text": "🏷 По тегу", "callback": "segment:tag", "url": None},
+    {"text": "⬅️ Назад", "callback": "sendall", "url": None}
+])
+INACTIVE_REASONS = {
+    "blocked": "заблокировали бота",
+    "kicked": "удалили бота из группы",
+    "deactivated": "удалённые аккаунты",
+    "chat_not_found": "чат не найден",
+    "forbidden": "нет доступа",
+    "left": "покинули бота",
+}
+
+async def preflight(message: Message,
+                    state: FSMContext,
+                    preview: Awaitable[Message],
+                    keep_state: bool = False) -> Message | None:
+    """
+    Пробная отправка админу перед рассылкой: битая разметка или слишком длинный текст
+    всплывают один раз здесь, а не ошибкой на каждом получателе.
+    keep_state — для шагов черновика: шаг не сбрасывается, админ просто вводит значение заново.
+    """
+    try:
+        return await preview
+    except TelegramBadRequest as error:
+        reason = f"<code>{escape(error.message, quote=False)}</code>"
+        if keep_state:
+            await message.answer(f"❌ Telegram не принял публикацию:\n{reason}\n\nИсправьте и отправьте ещё раз.")
+            return None
+        await message.answer(f"❌ Публикация не прошла проверку, рассылка не начата:\n{reason}\n\n"
+                             f"Исправьте объявление и создайте его заново.",
+                             reply_markup=ReplyKeyboardRemove())
+        await state.clear()
+        return None
+
+
+async def report_estimate(message: Message, segment: dict | None, method: str, requests_per_chat: int = 1) -> None:
+    result = estimate(await count_users(segment), requests_per_chat, method)
+    await message.answer(f"🧪 <b>Пробный запуск:</b> проверка пройдена, рассылка не начата.\n\n"
+                         f"👥 Получателей: {result.recipients}\n"
+                         f"📨 Запросов к Bot API: {result.requests}\n"
+                         f"⏱ Займёт примерно: {format_duration(result.seconds)}",
+                         reply_markup=PUBLISH_REPLY_KEYBOARD)
+
+
+async def run_broadcast(task_id: int,
+                        send: SendFunc,
+                        segment: dict | None = None,
+                        on_result: ResultFunc | None = None,
+                        runner: Broadcaster = broadcaster) -> BroadcastResult:
+    result = await deliver(task_id, send, segment=segment, on_result=on_result, runner=runner)
+    await mark_task_executed(task_id, sent=result.sent, failed=result.failed)
+    return result
+
+
+async def keep_task_alive(task_id: int) -> None:
+    while True:
+        await asyncio.sleep(TASK_HEARTBEAT)
         try:
-            await message.bot.send_message(
-                chat_id=chat_id,
-                text=news_text,
-                reply_markup=reply_markup
-            )
-        except TelegramBadRequest:
-            await message.answer("Произошла ошибка при рассылке.")
+            await heartbeat_task(task_id, TASK_OWNER)
+        except Exception:
+            logger.exception("Не удалось продлить аренду задачи %s", task_id)
 
-    await remove_task(task_id)
 
+async def broadcast_task(bot: Bot, task: dict) -> BroadcastResult | None:
+    # Несколько реплик бота поднимают одни и те же задачи: рассылает та, что первой её захватила.
+    if not await claim_task(task['id'], TASK_OWNER, TASK_LEASE_TIMEOUT):
+        logger.info("Задачу %s уже ведёт другой процесс", task['id'])
+        return None
 
-async def scheduled_send_media(message: Message,
-                               file_data: str,
-                               news_text: str,
-                               chats: list,
-                               task_id: int,
-                               button_text: str | None = None,
-                               button_url: str | None = None,
-                               ) -> None:
-    reply_markup = None
-    if button_text and button_url:
-        reply_markup = await inline_keyboards.create_keyboards([{"text": button_text, "url": button_url}])
+    heartbeat = asyncio.create_task(keep_task_alive(task['id']))
+    try:
+        return await run_campaign(bot, task)
+    except BaseException:
+        # При остановке или ошибке задача освобождается и продолжится после перезапуска.
+        await release_task(task['id'], TASK_OWNER)
+        raise
+    finally:
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+
+
+async def run_campaign(bot: Bot, task: dict) -> BroadcastResult:
+    # Пересекающиеся рассылки идут через общую очередь и делят лимит по приоритету.
+    async with campaign_scheduler.campaign(task['id'], task['priority']) as campaign:
+        if not campaign.running.is_set() and task['author_id']:
+            await bot.send_message(task['author_id'],
+                                   f"⏳ Публикация #{task['id']} в очереди: сейчас идут другие рассылки.")
+        await campaign.running.wait()
+
+        # Автор видит одно обновляемое сообщение о ходе рассылки и итоговую сводку ошибок.
+        total = await count_users(task['segment'])
+        if BROADCAST_SHARDS <= 1:
+            reporter = ProgressReporter(bot, task['author_id'], task['id'], total)
+        else:
+            reporter = ShardedProgressReporter(bot, task['author_id'], task['id'], total,
+                                               shards=BROADCAST_SHARDS, limiter=LeasedRateLimiter(lease_size=1))
 
-    for chat_id in chats:
+        await reporter.start()
         try:
-            if file_data:
-                if file_data.endswith(('.jpg', '.png')):
-                    await message.bot.send_photo(
-                        chat_id=chat_id,
-                        photo=file_data,
-                        caption=news_text,
-                        reply_markup=reply_markup
-                    )
-                elif file_data.endswith(('.mp3', '.wav')):
-                    await message.bot.send_audio(
-                        chat_id=chat_id,
-                        audio=file_data,
-                        caption=news_text,
-                        reply_markup=reply_markup
-                    )
-                elif file_data.endswith('.mp4'):
-                    await message.bot.send_video(
-                        chat_id=chat_id,
-                        video=file_data,
-                        caption=news_text,
-                        reply_markup=reply_markup
-                    )
-                elif file_data.endswith('.pdf'):
-                    await message.bot.send_document(
-                        chat_id=chat_id,
-                        document=file_data,
-                        caption=news_text,
-                        reply_markup=reply_markup
-                    )
+            if BROADCAST_SHARDS <= 1:
+                send = await task_sender(bot, task, campaign.limiter)
+                result = await run_broadcast(task['id'], send, task['segment'], reporter.record,
+                                             Broadcaster(campaign.limiter))
             else:
-                await message.answer(f"Не удалось найти файл для отправки в чат {chat_id}")
-        except TelegramBadRequest as e:
-            await message.answer(f"Произошла ошибка при рассылке в чат {chat_id}: {e}")
-    await remove_task(task_id)
+                # Шарды живут в других процессах: очередь решает, когда им стартовать,
+                # а лимит они делят через rate_leases.
+                result = await run_sharded(bot, task)
+                await mark_task_executed(task['id'], sent=result.sent, failed=result.failed)
+        finally:
+            await reporter.close()
+
+    await reporter.finish(result)
+    # Итоги отправлены — успешные строки журнала больше не нужны, а старые ошибки пора убрать.
+    await prune_deliveries(task['id'], timedelta(days=DELIVERY_RETENTION_DAYS))
+    return result
+
+
+async def scheduled_send(bot: Bot, task_id: int) -> None:
+    task = await get_task(task_id)
+    if not task or task['is_executed']:
+        return
+
+    await broadcast_task(bot, task)
+
+
+async def scheduled_send_media(bot: Bot, task_id: int) -> None:
+    task = await get_task(task_id)
+    if not task or task['is_executed']:
+        return
+
+    if not task['file_data']:
+        if task['author_id']:
+            await bot.send_message(task['author_id'], "Не удалось найти файл для отправки.")
+        await mark_task_executed(task_id)
+        return
+
+    await broadcast_task(bot, task)
+
+
+# Запущенные из админки рассылки идут в фоне: хендлер публикации сразу отпускает
+# блокировку FSM чата автора, и тот может ставить рассылку на паузу.
+background_broadcasts: set[asyncio.Task] = set()
+
+
+def _broadcast_done(task: asyncio.Task) -> None:
+    background_broadcasts.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Рассылка завершилась с ошибкой", exc_info=task.exception())
+
+
+def start_broadcast(job: Callable[[Bot, int], Awaitable[None]], bot: Bot, task_id: int) -> asyncio.Task:
+    task = asyncio.create_task(job(bot, task_id))
+    background_broadcasts.add(task)
+    task.add_done_callback(_broadcast_done)
+    return task
+
+
+async def stop_broadcasts() -> None:
+    # Задачи остаются в базе: начатые restore_scheduled_tasks продолжит после перезапуска,
+    # а журналы доставок дописываются при отмене.
+    for task in list(background_broadcasts):
+        task.cancel()
+    await asyncio.gather(*background_broadcasts, return_exceptions=True)
+
+
+async def run_scheduled_task(task_id: int) -> None:
+    task = await get_task(task_id)
+    if not task or task['is_executed']:
+        return
+
+    job = scheduled_send_media if task['file_data'] else scheduled_send
+    # Через start_broadcast, чтобы остановка бота отменяла и запланированные рассылки.
+    start_broadcast(job, get_bot(), task_id)
+
+
+async def resume_stale_tasks() -> None:
+    for task_id in await get_stale_tasks(TASK_LEASE_TIMEOUT):
+        schedule_task(task_id)
+
+
+def schedule_task(task_id: int, run_at: datetime | None = None) -> None:
+    scheduler.add_job(
+        run_scheduled_task,
+        'date',
+        run_date=run_at,
+        id=f"task:{task_id}",
+        replace_existing=True,
+        kwargs={"task_id": task_id}
+    )
+
+
+async def restore_scheduled_tasks(bot: Bot) -> None:
+    now = datetime.now()
+    for task in await get_pending_tasks():
+        run_at = datetime.fromisoformat(str(task['run_at']))
+        lateness = (now - run_at).total_seconds()
+
+        if lateness <= 0:
+            schedule_task(task['id'], run_at)
+        elif task['started_at'] or lateness <= SCHEDULE_MISFIRE_GRACE:
+            schedule_task(task['id'])
+        # Пропуск тоже отмечает одна реплика, иначе автор получит уведомление от каждой.
+        elif await mark_task_executed(task['id']) and task['author_id']:
+            await bot.send_message(
+                task['author_id'],
+                f"⚠️ Публикация, запланированная на <b>{run_at.strftime('%d.%m.%Y %H:%M')}</b>, "
+                f"пропущена: бот был недоступен в это время."
+            )
+
+    # Задачи упавших реплик подхватывает любая живая, не дожидаясь их перезапуска.
+    scheduler.add_job(resume_stale_tasks, 'interval', seconds=TASK_LEASE_TIMEOUT,
+                      id="resume_stale_tasks", replace_existing=True)
 
 @admin.message(IsAdmin(), Command("apanel"))
 async def open_panel(message: Message, state: FSMContext) -> None:
-    buttons = [
-        {"text": "🧑‍✈️ Список админов", "callback": "admins_list", "url": None},
-        {"text": "🔔 Сделать объявление", "callback": "sendall", "url": None},
-        {"text": "📊 Статистика", "callback": "static", "url": None},
-        {"text": "💳 Цены на курсы", "callback": "course_price", "url": None},
-        {"text": "❌ Закрыть меню", "callback": "close_menu", "url": None}
-    ]
-
     await message.answer(f"<b>Добро пожаловать в Админ-панель🗂</b>\n\n"
                         f"Выбери один из пунктов для управления ботом👇",
-                        reply_markup=await inline_keyboards.create_keyboards(buttons))
+                        reply_markup=PANEL_KEYBOARD)
 
     await state.set_state(AdminStates.choice_item)
 
@@ -128,52 +354,205 @@ async def cmd_close_menu(callback: CallbackQuery, state: FSMContext) -> None:
 @admin.callback_query(F.data == "static")
 async def all_users(callback: CallbackQuery) -> None:
     await callback.message.delete()
-    users = await get_all_users()
-    clients = await get_all_users(only_clients=True)
+    stats = await get_statistics()
+
+    throughput = stats["last_throughput"]
+    throughput_text = f"{throughput:.1f} сообщ./сек" if throughput is not None else "нет данных"
+    inactive_text = "".join(
+        f"\n    • {INACTIVE_REASONS.get(reason, reason)}: {count}"
+        for reason, count in sorted(stats["inactive_reasons"].items(), key=lambda item: -item[1])
+    )
 
     await callback.message.answer(f"📊 <b>Статистика по пользователям бота:</b>\n\n"
-                                  f"👤 <b>Всего пользователей: {len(users)}</b>\n"
-                                  f"🥇 <b>Количество клиентов: {len(clients)}</b>",
-                                  reply_markup=await inline_keyboards.create_keyboard(text="⬅️ Назад", callback="back_to_menu", url=None))
+                                  f"👤 <b>Всего пользователей: {stats['users']}</b>\n"
+                                  f"🥇 <b>Количество клиентов: {stats['clients']}</b>\n"
+                                  f"🆕 <b>Новых за сегодня: {stats['new_today']}</b>\n"
+                                  f"📅 <b>Новых за 7 дней: {stats['new_week']}</b>\n"
+                                  f"🚫 <b>Неактивных чатов: {stats['inactive']}</b>"
+                                  f"{inactive_text}\n"
+                                  f"🧹 <b>Исключено за 7 дней: {stats['pruned_week']}</b>\n"
+                                  f"🚀 <b>Скорость последней рассылки: {throughput_text}</b>",
+                                  reply_markup=BACK_TO_MENU_KEYBOARD)
+
+@admin.callback_query(F.data == "metrics")
+async def show_metrics(callback: CallbackQuery) -> None:
+    await callback.message.delete()
+
+    api_lines = []
+    for (method,) in sorted(metrics.api_requests.values, key=lambda labels: -metrics.api_requests.get(*labels))[:5]:
+        p50 = metrics.api_latency.quantile(0.5, method)
+        p99 = metrics.api_latency.quantile(0.99, method)
+        # Счётчик запросов растёт до отправки, задержка — после ответа: у запросов в пути её ещё нет.
+        latency = "задержка: нет данных" if p50 is None else f"p50 ≤ {p50 * 1000:.0f} мс, p99 ≤ {p99 * 1000:.0f} мс"
+        api_lines.append(f"• {method}: {int(metrics.api_requests.get(method))}, {latency}")
+
+    db_lines = []
+    for (function,) in sorted(metrics.db_latency.sums, key=lambda labels: -metrics.db_latency.sums[labels])[:5]:
+        calls = metrics.db_latency.count(function)
+        db_lines.append(f"• {function}: {calls} выз., ср. {metrics.db_latency.sums[(function,)] / calls * 1000:.1f} мс")
+
+    await callback.message.answer(
+        f"📊 <b>Метрики бота:</b>\n\n"
+        f"🚀 <b>Скорость рассылки: {metrics.send_rate.rate():.1f} сообщ./сек</b>\n"
+        f"✅ Доставлено: {int(metrics.broadcast_sent.total())}\n"
+        f"❌ Не доставлено: {int(metrics.broadcast_failed.total())}\n"
+        f"⏳ В очереди: {int(metrics.broadcast_queue_depth.get('pending'))}, "
+        f"на повторе: {int(metrics.broadcast_queue_depth.get('retry'))}\n"
+        f"⚠️ 429: {int(metrics.api_flood_errors.total())}, 🚫 403: {int(metrics.api_forbidden_errors.total())}\n"
+        f"🔌 Соединения: новых {int(metrics.http_connections.get('created'))}, "
+        f"переиспользовано {int(metrics.http_connections.get('reused'))}, "
+        f"ожиданий пула {int(metrics.http_connections.get('queued'))}\n\n"
+        f"🌐 <b>Bot API:</b>\n" + ("\n".join(api_lines) or "нет данных") + "\n\n"
+        f"🗄 <b>База данных:</b>\n" + ("\n".join(db_lines) or "нет данных"),
+        reply_markup=BACK_TO_MENU_KEYBOARD
+    )
+    await callback.answer()
+
+CAMPAIGN_STATES = {
+    "running": "идёт",
+    "queued": "в очереди",
+    "preempted": "уступила срочной",
+    "paused": "на паузе",
+}
+CAMPAIGN_PRIORITIES = {
+    "urgent": "⚡ срочная",
+    "bulk": "📦 обычная",
+}
+
+def campaigns_view() -> tuple[str, InlineKeyboardMarkup]:
+    campaigns = campaign_scheduler.ordered()
+    lines = [f"• #{campaign.task_id} {CAMPAIGN_PRIORITIES[campaign.priority]} — {CAMPAIGN_STATES[campaign.state]}"
+             for campaign in campaigns]
+
+    buttons = []
+    # Шарды работают в других процессах, их на паузу отсюда не поставить.
+    if BROADCAST_SHARDS <= 1:
+        for campaign in campaigns:
+            if campaign.state == "paused":
+                buttons.append({"text": f"▶️ #{campaign.task_id}", "callback": f"campaign_resume:{campaign.task_id}",
+                                "url": None})
+            else:
+                buttons.append({"text": f"⏸ #{campaign.task_id}", "callback": f"campaign_pause:{campaign.task_id}",
+                                "url": None})
+    buttons.append({"text": "🔄 Обновить", "callback": "campaigns_refresh", "url": None})
+    buttons.append({"text": "⬅️ Назад", "callback": "back_to_menu", "url": None})
+
+    text = "📬 <b>Очередь рассылок:</b>\n\n" + ("\n".join(lines) or "Сейчас рассылок нет.")
+    return text, inline_keyboards.build_keyboards(buttons)
+
+@admin.callback_query(F.data == "campaigns")
+async def show_campaigns(callback: CallbackQuery) -> None:
+    await callback.message.delete()
+    text, reply_markup = campaigns_view()
+    await callback.message.answer(text, reply_markup=reply_markup)
+    await callback.answer()
+
+@admin.callback_query(F.data == "campaigns_refresh")
+@admin.callback_query(F.data.startswith("campaign_pause:"))
+@admin.callback_query(F.data.startswith("campaign_resume:"))
+async def control_campaign(callback: CallbackQuery) -> None:
+    action, _, task_id = callback.data.partition(":")
+    if action == "campaign_pause":
+        campaign_scheduler.pause(int(task_id))
+    elif action == "campaign_resume":
+        campaign_scheduler.resume(int(task_id))
+
+    text, reply_markup = campaigns_view()
+    try:
+        await callback.message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest:
+        # Ничего не изменилось — Telegram не даёт отредактировать сообщение тем же текстом.
+        pass
+    await callback.answer()
 
 @admin.callback_query(F.data == "admins_list")
-async def admins_list(callback: CallbackQuery, bot) -> None:
+async def admins_list(callback: CallbackQuery, bot, state: FSMContext) -> None:
+    await state.set_state(AdminStates.choice_item)
     await callback.message.delete()
+    admin_ids = sorted(admin_registry.ids, key=lambda admin_id: (not admin_registry.is_owner(admin_id), admin_id))
+    profiles = await chat_profiles.get_many(bot, admin_ids)
     admins_info = []
-    for index, admin_id in enumerate(ADMINS_IDS, start=1):
-        admin = await bot.get_chat(admin_id)
-        admin_name = admin.first_name
-        if admin.username:
-            link = f"<a href='https://t.me/{admin.username}'>{admin_name}</a>"
-        else:
-            link = f"<a href='https://t.me/{admin_id}'>{admin_name}</a>"
-        admins_info.append(f"{index}. {link}")
+    for index, admin_id in enumerate(admin_ids, start=1):
+        profile = profiles[admin_id]
+        name = profile.link() if profile else "неизвестный пользователь"
+        admins_info.append(f"{index}. {name} (<code>{admin_id}</code>)")
 
     admins_list_message = "\n".join(admins_info)
     await callback.message.answer(
         f"<b>Список админов:</b>\n\n{admins_list_message}",
         disable_web_page_preview=True,
-        reply_markup=await inline_keyboards.create_keyboard(text="⬅️ Назад", callback="back_to_menu", url=None)
+        reply_markup=ADMINS_KEYBOARD
     )
     await callback.answer()
 
+def admin_target(message: Message) -> int | None:
+    if message.forward_origin is not None and message.forward_origin.type == "user":
+        return message.forward_origin.sender_user.id
+    if message.text and message.text.strip().lstrip("-").isdigit():
+        return int(message.text.strip())
+    return None
+
+@admin.callback_query(F.data == "add_admin")
+async def ask_admin_to_add(callback: CallbackQuery, state: FSMContext) -> None:
+    await state.set_state(AdminStates.add_admin)
+    await callback.message.edit_text("Отправьте Telegram ID нового админа или перешлите его сообщение.",
+                                     reply_markup=BACK_TO_MENU_KEYBOARD)
+    await callback.answer()
+
+@admin.callback_query(F.data == "remove_admin")
+async def ask_admin_to_remove(callback: CallbackQuery, state: FSMContext) -> None:
+    await state.set_state(AdminStates.remove_admin)
+    await callback.message.edit_text("Отправьте Telegram ID админа, которого нужно удалить.",
+                                     reply_markup=BACK_TO_MENU_KEYBOARD)
+    await callback.answer()
+
+@admin.message(AdminStates.add_admin)
+async def add_admin(message: Message, state: FSMContext) -> None:
+    admin_id = admin_target(message)
+    if admin_id is None:
+        await message.answer("ID должен быть числом. Попробуйте ещё раз.", reply_markup=BACK_TO_MENU_KEYBOARD)
+        return
+
+    profile = await chat_profiles.get(message.bot, admin_id)
+    name = profile.link() if profile else f"<code>{admin_id}</code>"
+    if await admin_registry.add(admin_id):
+        await message.answer(f"✅ Админ {name} добавлен.", reply_markup=BACK_TO_MENU_KEYBOARD)
+    else:
+        await message.answer(f"{name} уже является админом.", reply_markup=BACK_TO_MENU_KEYBOARD)
+    await state.set_state(AdminStates.choice_item)
+
+@admin.message(AdminStates.remove_admin)
+async def delete_admin(message: Message, state: FSMContext) -> None:
+    admin_id = admin_target(message)
+    if admin_id is None:
+        await message.answer("ID должен быть числом. Попробуйте ещё раз.", reply_markup=BACK_TO_MENU_KEYBOARD)
+        return
+
+    try:
+        removed = await admin_registry.remove(admin_id)
+    except ValueError as error:
+        await message.answer(str(error), reply_markup=BACK_TO_MENU_KEYBOARD)
+        return
+
+    if removed:
+        await message.answer(f"🗑 Админ <code>{admin_id}</code> удалён.", reply_markup=BACK_TO_MENU_KEYBOARD)
+    else:
+        await message.answer(f"<code>{admin_id}</code> не найден среди админов.", reply_markup=BACK_TO_MENU_KEYBOARD)
+    await state.set_state(AdminStates.choice_item)
+
 @admin.callback_query(F.data == "back_to_types_news")
 async def back_to_news(callback: CallbackQuery, state: FSMContext) -> None:
-    await state.set_state(AdminStates.choice_type_news)
-    await cmd_send(callback, state)
+    await callback.message.delete()
+    await show_news_types(callback.message, state)
     await callback.answer()
 
 @admin.callback_query(F.data == "sendall")
 async def choice_time(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.message.delete()
-    buttons = [
-        {"text": "Сейчас", "callback": "now", "url": None},
-        {"text": "В другое время", "callback": "any_time", "url": None},
-        {"text": "⬅️ Назад", "callback": "back_to_menu", "url": None}
-    ]
+    await state.set_data({})
     await callback.message.answer(
         "Выберите время публикации",
-        reply_markup=await inline_keyboards.create_keyboards(buttons, row_width=2)
+        reply_markup=CHOICE_TIME_KEYBOARD
     )
     await state.set_state(AdminStates.choice_time_news)
 
@@ -183,7 +562,7 @@ async def select_time(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.message.answer(
         "Укажите дату публикации в формате <b>D.M.Y</b>\n"
         "Пример: <code>15.12.2024</code>",
-        reply_markup=await inline_keyboards.create_keyboard("⬅️ Назад", "sendall", None)
+        reply_markup=inline_keyboards.build_keyboard("⬅️ Назад", "sendall", None)
     )
     await state.update_data(choice_time_selected=True)
     await state.set_state(AdminStates.choice_data)
@@ -203,11 +582,11 @@ async def select_time(message: Message, state: FSMContext) -> None:
         await message.answer("Неверный формат даты! Пожалуйста, введите в формате <b>D.M.Y</b> (например, 15.12.2024).")
         return
 
-    await state.update_data(publication_date=selected_date)
+    await state.update_data(publication_date=selected_date.isoformat())
 
     await message.answer("Укажите время публикации, в формате: <b>HH:MM</b>\n"
                          "Пример: <code>12:30</code>",
-                         reply_markup=await inline_keyboards.create_keyboard("⬅️ Назад", "sendall", None))
+                         reply_markup=inline_keyboards.build_keyboard("⬅️ Назад", "sendall", None))
 
     await state.set_state(AdminStates.choice_time)
 
@@ -230,7 +609,7 @@ async def select_time(message: Message, state: FSMContext) -> None:
         await state.clear()
         return
 
-    publication_datetime = datetime.combine(publication_date, selected_time)
+    publication_datetime = datetime.combine(date.fromisoformat(publication_date), selected_time)
 
     if publication_datetime < datetime.now():
         await message.answer(
@@ -238,12 +617,12 @@ async def select_time(message: Message, state: FSMContext) -> None:
         )
         return
 
-    await state.update_data(publication_time=selected_time)
+    await state.update_data(publication_time=selected_time.isoformat())
 
     await message.answer(
         f"✅ Публикация запланирована на <b>{publication_datetime.strftime('%d.%m.%Y %H:%M')}</b>.\n"
         "Подтвердите или измените время.",
-        reply_markup=await inline_keyboards.create_keyboard(text="✅ Подтвердить",
+        reply_markup=inline_keyboards.build_keyboard(text="✅ Подтвердить",
                                                             callback="selected_time",
                                               url=None)
     )
@@ -257,16 +636,76 @@ async def selected_time(callback: CallbackQuery, state: FSMContext) -> None:
 @admin.callback_query(F.data == "now", AdminStates.choice_time_news)
 async def cmd_send(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.message.delete()
-    buttons = [
-        {"text": "📝 Текстовое", "callback": "news_text", "url": None},
-        {"text": "🖼 Медийное", "callback": "news_media", "url": None},
-        {"text": "⬅️ Назад", "callback": "back_to_menu", "url": None}
-    ]
-    await callback.message.answer("Выберите тип объявления👇",
-                                  reply_markup=await inline_keyboards.create_keyboards(buttons=buttons))
+    await callback.message.answer("Кому отправить объявление?👇",
+                                  reply_markup=SEGMENT_KEYBOARD)
+    await state.set_state(AdminStates.choice_segment)
+    await callback.answer()
+
+def segment_title(segment: dict | None) -> str:
+    if not segment:
+        return SEGMENT_TITLES["all"]
+    if segment.get("language"):
+        return f"язык: {segment['language']}"
+    if segment.get("tag"):
+        return f"тег: {segment['tag']}"
+    return next((SEGMENT_TITLES[name] for name, preset in SEGMENTS.items() if preset == segment), "выборка")
+
+async def show_news_types(message: Message, state: FSMContext) -> None:
+    data = await state.get_data()
+    segment = data.get("segment")
+    audience = await count_users(segment)
+    await message.answer(f"👥 Аудитория: <b>{segment_title(segment)}</b> — {audience} чат(ов)\n\n"
+                         f"Выберите тип объявления👇",
+                         reply_markup=NEWS_TYPE_KEYBOARD)
     await state.set_state(AdminStates.choice_type_news)
+
+@admin.callback_query(F.data.startswith("segment:"), AdminStates.choice_segment)
+async def choose_segment(callback: CallbackQuery, state: FSMContext) -> None:
+    name = callback.data.removeprefix("segment:")
+    await callback.message.delete()
+
+    if name == "language":
+        await state.set_state(AdminStates.segment_language)
+        await callback.message.answer("Введите код языка, например: <code>ru</code>, <code>en</code>, <code>uz</code>")
+    elif name == "tag":
+        tags = await get_tags()
+        tags_text = "\n".join(f"• <code>{tag}</code> — {count}" for tag, count in tags.items()) or "Тегов пока нет."
+        await state.set_state(AdminStates.segment_tag)
+        await callback.message.answer(f"Введите тег аудитории.\n\n{tags_text}")
+    else:
+        await state.update_data(segment=SEGMENTS.get(name))
+        await show_news_types(callback.message, state)
     await callback.answer()
 
+@admin.message(AdminStates.segment_language, F.text)
+async def choose_segment_language(message: Message, state: FSMContext) -> None:
+    language = message.text.strip().lower()
+    if len(language) != 2 or not language.isalpha():
+        await message.answer("Код языка должен состоять из двух букв. Попробуйте ещё раз.")
+        return
+    await state.update_data(segment={"language": language})
+    await show_news_types(message, state)
+
+@admin.message(AdminStates.segment_tag, F.text)
+async def choose_segment_tag(message: Message, state: FSMContext) -> None:
+    await state.update_data(segment={"tag": message.text.strip()})
+    await show_news_types(message, state)
+
+@admin.message(Command("tag", "untag"))
+async def cmd_tag(message: Message, command: CommandObject) -> None:
+    args = (command.args or "").split()
+    if len(args) < 2 or not all(arg.lstrip("-").isdigit() for arg in args[1:]):
+        await message.answer(f"Использование: <code>/{command.command} тег id [id ...]</code>")
+        return
+
+    tag, tg_ids = args[0], [int(arg) for arg in args[1:]]
+    if command.command == "tag":
+        changed = await tag_users(tag, tg_ids)
+        await message.answer(f"🏷 Тег <code>{tag}</code> добавлен {changed} чат(ам).")
+    else:
+        changed = await untag_users(tag, tg_ids)
+        await message.answer(f"🏷 Тег <code>{tag}</code> снят с {changed} чат(ов).")
+
 @admin.callback_query(IsAdmin(), F.data == "news_text")
 async def news_text(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.message.delete()
@@ -276,21 +715,22 @@ async def news_text(callback: CallbackQuery, state: FSMContext) -> None:
     await state.set_state(AdminStates.news_text)
     await callback.message.answer(f"Введите текст для отправки объявления\n"
                                   f"Не больше <b>4096</b> сиволов.",
-                                  reply_markup=await inline_keyboards.create_keyboards(buttons))
+                                  reply_markup=inline_keyboards.build_keyboards(buttons))
     await callback.answer()
 
 @admin.message(IsAdmin(), AdminStates.news_text)
 async def news_text(message: Message, state: FSMContext) -> None:
-    await state.update_data(news_message=message.text)
-    data = await state.get_data()
     buttons = [
         {"text": "📌 Добавить кнопку со ссылкой", "callback": "add_link_btn", "url": None},
         {"text": "✅ Перейти к публикации", "callback": "go_to_publish", "url": None},
         {"text": "❌ Отменить публикацию", "callback": "back_to_menu", "url": None},
     ]
-    await message.answer(f"<b>Текстовое объявление:</b>\n\n"
-                         f"{data['news_message']}",
-                         reply_markup=await inline_keyboards.create_keyboards(buttons, row_width=1))
+    await message.answer("<b>Текстовое объявление:</b>")
+    # Черновик показываем как есть: битая разметка всплывёт здесь, и текст можно ввести заново.
+    preview = message.answer(message.text, reply_markup=inline_keyboards.build_keyboards(buttons, row_width=1))
+    if await preflight(message, state, preview, keep_state=True) is None:
+        return
+    await state.update_data(news_message=message.text)
 
 @admin.callback_query(F.data == "add_link_btn")
 async def add_btn(callback: CallbackQuery, state: FSMContext) -> None:
@@ -314,27 +754,24 @@ async def create_link(message: Message, state: FSMContext) -> None:
         await message.answer("❌ Некорректный URL. Убедитесь, что он начинается с http:// или https://.")
         return
 
-    await state.update_data(btn_link=message.text)
     data = await state.get_data()
 
     inline_buttons = [
-        {"text": data['btn_name'], "callback": None, "url": data['btn_link']}
+        {"text": data['btn_name'], "callback": None, "url": message.text}
     ]
 
-    reply_buttons = ["✅ Опубликовать", "❌ Отменить"]
+    # Ссылку Telegram проверяет сам: с отвергнутой остаёмся на этом шаге.
+    preview = message.answer(data['news_message'], reply_markup=inline_keyboards.build_keyboards(inline_buttons))
+    if await preflight(message, state, preview, keep_state=True) is None:
+        return
 
     await message.answer(
         "✅ <b>Готово!</b>\n"
         "Ваша публикация готова к рассылке",
-        reply_markup=await reply_keyboards.create_keyboards(row=1, texts=reply_buttons)
+        reply_markup=PUBLISH_REPLY_KEYBOARD
     )
 
-    await message.answer(
-        f"{data['news_message']}",
-        reply_markup=await inline_keyboards.create_keyboards(inline_buttons)
-    )
-
-    await state.update_data(markup=inline_buttons)
+    await state.update_data(btn_link=message.text, markup=inline_buttons)
 
     await state.set_state(AdminStates.go_to_publish)
 
@@ -343,10 +780,8 @@ async def cmd_publish(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.message.delete()
     data = await state.get_data()
 
-    reply_buttons = ["✅ Опубликовать", "❌ Отменить"]
-
     await callback.message.answer("<b>Текстовое объявление</b>",
-                                  reply_markup=await reply_keyboards.create_keyboards(row=1, texts=reply_buttons))
+                                  reply_markup=PUBLISH_REPLY_KEYBOARD)
     await callback.message.answer(data['news_message'])
 
     await state.set_state(AdminStates.go_to_publish)
@@ -359,63 +794,69 @@ async def cancel_news(message: Message, state: FSMContext) -> None:
     await state.clear()
 
 
-@admin.message(IsAdmin(), F.text == "✅ Опубликовать", AdminStates.go_to_publish)
+def news_markup(data: dict):
+    return inline_keyboards.build_keyboards(data["markup"]) if "markup" in data else None
+
+@admin.message(IsAdmin(), F.text.in_({PUBLISH_TEXT, URGENT_TEXT}), AdminStates.go_to_publish)
 async def publish_news(message: Message, state: FSMContext) -> None:
     data = await state.get_data()
-    all_chats = await get_all_users()
+    # Срочная публикация обгоняет обычные рассылки в общей очереди.
+    priority = "urgent" if message.text == URGENT_TEXT else "bulk"
+
+    await message.answer("<b>Ваша публикация:</b>")
+    # Превью — и проверка перед рассылкой, и шаблон: получатели получат его копию через copy_message.
+    preview = await preflight(message, state, message.answer(data["news_message"], reply_markup=news_markup(data)))
+    if preview is None:
+        return
 
     if data.get("choice_time_selected"):
         publication_date = data.get("publication_date")
         publication_time = data.get("publication_time")
 
         run_at = datetime.strptime(f"{publication_date} {publication_time}", "%Y-%m-%d %H:%M:%S")
-        run_at_str = run_at.isoformat()
 
-        await add_task(
-            run_at=run_at_str,
+        task_id = await add_task(
+            run_at=run_at.isoformat(),
             news_text=data.get("news_message"),
             button_text=data.get("btn_name"),
-            button_url=data.get("btn_link")
+            button_url=data.get("btn_link"),
+            author_id=message.chat.id,
+            segment=data.get("segment"),
+            priority=priority,
+            template_chat_id=preview.chat.id,
+            template_message_id=preview.message_id
         )
 
-        task = await get_task(run_at=run_at_str)
-
-        scheduler.add_job(
-            scheduled_send,
-            'date',
-            run_date=task['run_at'],
-            kwargs={
-                "message": message,
-                "news_text": task['news_text'],
-                "task_id": task['id'],
-                "chats": all_chats,
-                "button_text": task['button_text'],
-                "button_url": task['button_url']
-            }
-        )
+        schedule_task(task_id, run_at)
 
-        await message.answer(f"Ваша публикация")
-        await message.answer(f"<b>{data['news_message']}</b>",
-                             reply_markup=await inline_keyboards.create_keyboards(
-                                 data.get("markup", [])) if "markup" in data else None)
         await message.answer(f"будет отправлена в <b>{publication_date} {publication_time}</b>",
                              reply_markup=ReplyKeyboardRemove())
 
         return
 
-    for chat_id in all_chats:
-        try:
-            await message.bot.send_message(
-                chat_id=chat_id,
-                text=data["news_message"],
-                reply_markup=await inline_keyboards.create_keyboards(
-                    data.get("markup", [])) if "markup" in data else None
-            )
-        except TelegramBadRequest:
-            await message.answer("Ошибка при публикации рассылки, возможно, бот не является Администратором чата.")
-
-    await message.answer("✅ Объявление успешно опубликовано!", reply_markup=ReplyKeyboardRemove())
+    task_id = await add_task(
+        run_at=datetime.now().isoformat(),
+        news_text=data["news_message"],
+        button_text=data.get("btn_name"),
+        button_url=data.get("btn_link"),
+        author_id=message.chat.id,
+        segment=data.get("segment"),
+        priority=priority,
+        template_chat_id=preview.chat.id,
+        template_message_id=preview.message_id
+    )
+    await message.answer(f"🚀 Публикация #{task_id} запущена, ход рассылки — в следующем сообщении.",
+                         reply_markup=ReplyKeyboardRemove())
     await state.clear()
+    start_broadcast(scheduled_send, message.bot, task_id)
+
+@admin.message(IsAdmin(), F.text == DRY_RUN_TEXT, AdminStates.go_to_publish)
+async def dry_run_news(message: Message, state: FSMContext) -> None:
+    data = await state.get_data()
+    if await preflight(message, state, message.answer(data["news_message"], reply_markup=news_markup(data))) is None:
+        return
+
+    await report_estimate(message, data.get("segment"), "copyMessage" if BROADCAST_TEMPLATE_MODE else "sendMessage")
 
 @admin.callback_query(F.data == "news_media")
 async def news_media(callback: CallbackQuery, state: FSMContext) -> None:
@@ -424,13 +865,15 @@ async def news_media(callback: CallbackQuery, state: FSMContext) -> None:
         {"text": "⬅️ Назад", "callback": "back_to_types_news", "url": None}
     ]
     await state.set_state(AdminStates.news_media)
+    await state.update_data(album=[], media_group_id=None)
     await callback.message.answer(
         "<b>Вы можете отправить одно из:</b>\n\n"
         "📷 Фотографию\n"
         "📹 Видео\n"
         "🎧 Аудио\n"
-        "📄 Документ",
-        reply_markup=await inline_keyboards.create_keyboards(buttons)
+        "📄 Документ\n\n"
+        f"Несколько файлов (до {ALBUM_LIMIT}) будут отправлены одним альбомом.",
+        reply_markup=inline_keyboards.build_keyboards(buttons)
     )
     await callback.answer()
 
@@ -452,12 +895,53 @@ async def handle_media(message: Message, state: FSMContext) -> None:
         await message.answer("❌ Не удалось определить тип медиа. Попробуйте снова.")
         return
 
-    await state.update_data(media_id=media_id, media_type=media_type)
+    previous_group = None
+
+    def add_file(data: dict) -> dict | None:
+        nonlocal previous_group
+        previous_group = data.get("media_group_id")
+        album = data.get("album", [])
+        if not album_accepts(album, media_type):
+            return None
+        album = [*album, {"type": media_type, "media": media_id}]
+        return {**data, "album": album, "media_id": album[0]["media"], "media_type": album[0]["type"],
+                "media_group_id": message.media_group_id}
+
+    # Части альбома могут обрабатываться разными процессами одновременно — дописываем файл атомарно.
+    if await modify_data(state, add_file) is None:
+        await message.answer(f"❌ В альбом можно добавить до {ALBUM_LIMIT} файлов; фото и видео "
+                             f"нельзя смешивать с аудио и документами.")
+        return
+
+    # Альбом приходит пачкой сообщений — отвечаем один раз на всю пачку.
+    if message.media_group_id and message.media_group_id == previous_group:
+        return
     await message.answer(
+        "Медиа добавлено. Отправьте ещё файлы, чтобы собрать альбом, или нажмите «Далее».",
+        reply_markup=MEDIA_DONE_KEYBOARD
+    )
+
+@admin.callback_query(F.data == "media_done", AdminStates.news_media)
+async def media_done(callback: CallbackQuery, state: FSMContext) -> None:
+    data = await state.get_data()
+    await callback.message.delete()
+    await callback.message.answer(
+        f"Файлов в публикации: <b>{len(data.get('album', []))}</b>\n\n"
         "Введите описание для медиа-контента:\n"
-        "Не больше <b>1096</b> символов.",
+        f"Не больше <b>{CAPTION_LIMIT}</b> символов.",
     )
     await state.set_state(AdminStates.media_handle_state)
+    await callback.answer()
+
+async def preview_media(bot: Bot, chat_id: int, data: dict, caption: str, reply_markup=None) -> Message:
+    album = data.get("album", [])
+    if len(album) < 2:
+        return await send_media(bot, chat_id, data["media_type"], data["media_id"], caption, reply_markup)
+
+    messages = await send_album(bot, chat_id, album, caption)
+    if reply_markup is not None:
+        await bot.send_message(chat_id, ALBUM_BUTTON_TEXT, reply_markup=reply_markup)
+    return messages[0]
 
 @admin.message(IsAdmin(), F.text, AdminStates.media_handle_state)
 async def handle_media_caption(message: Message, state: FSMContext) -> None:
@@ -467,25 +951,18 @@ async def handle_media_caption(message: Message, state: FSMContext) -> None:
     buttons = [
         {"text": "📌 Добавить кнопку со ссылкой", "callback": "add_link_btn_media", "url": None},
         {"text": "✅ Опубликовать", "callback": "go_to_publish_media", "url": None},
+        {"text": DRY_RUN_TEXT, "callback": "dry_run_media", "url": None},
         {"text": "❌ Отменить публикацию", "callback": "back_to_menu", "url": None},
     ]
 
-    if len(caption) > 1096:
+    if len(caption) > CAPTION_LIMIT:
         await message.answer("❌ Описание слишком длинное. Попробуйте снова.")
         return
 
-    media_type = data["media_type"]
-    media_id = data["media_id"]
-
-    if media_type == "photo":
-        await message.answer_photo(media_id, caption=caption,                                  reply_markup=await inline_keyboards.create_keyboards(buttons, row_width=1))
-    elif media_type == "video":
-        await message.answer_video(media_id, caption=caption,                                reply_markup=await inline_keyboards.create_keyboards(buttons, row_width=1))
-    elif media_type == "audio":
-        await message.answer_audio(media_id, caption=caption,                               reply_markup=await inline_keyboards.create_keyboards(buttons, row_width=1))
-    elif media_type == "document":
-        await message.answer_document(media_id, caption=caption,
-                                      reply_markup=await inline_keyboards.create_keyboards(buttons, row_width=1))
+    preview = preview_media(message.bot, message.chat.id, data, caption,
+                            inline_keyboards.build_keyboards(buttons, row_width=1))
+    if await preflight(message, state, preview, keep_state=True) is None:
+        return
     await state.update_data(caption=caption)
 
 @admin.callback_query(F.data == "add_link_btn_media", AdminStates.media_handle_state)
@@ -505,8 +982,6 @@ async def handle_button_text(message: Message, state: FSMContext) -> None:
 async def handle_button_url(message: Message, state: FSMContext) -> None:
     url = message.text
 
-    reply_buttons = ["✅ Опубликовать", "❌ Отменить"]
-
     if not url.startswith("http://") and not url.startswith("https://"):
         await message.answer("❌ Некорректный URL. Убедитесь, что он начинается с http:// или https://.")
         return
@@ -515,28 +990,19 @@ async def handle_button_url(message: Message, state: FSMContext) -> None:
     button_text = data.get("button_text")
 
     new_button = {"text": button_text, "url": url}
-    buttons = data.get("buttons", [])
-    buttons.append(new_button)
-
-    await state.update_data(buttons=buttons)
+    buttons = [*data.get("buttons", []), new_button]
 
-    media_type = data["media_type"]
-    media_id = data["media_id"]
     caption = data.get("caption", "")
 
-    reply_markup = await inline_keyboards.create_keyboards(buttons=buttons, row_width=1)
+    reply_markup = inline_keyboards.build_keyboards(buttons=buttons, row_width=1)
 
-    if media_type == "photo":
-        await message.answer_photo(media_id, caption=caption, reply_markup=reply_markup)
-    elif media_type == "video":
-        await message.answer_video(media_id, caption=caption, reply_markup=reply_markup)
-    elif media_type == "audio":
-        await message.answer_audio(media_id, caption=caption, reply_markup=reply_markup)
-    elif media_type == "document":
-        await message.answer_document(media_id, caption=caption, reply_markup=reply_markup)
+    if await preflight(message, state, preview_media(message.bot, message.chat.id, data, caption, reply_markup),
+                       keep_state=True) is None:
+        return
+    await state.update_data(buttons=buttons)
 
     await message.answer("✅ Кнопка успешно добавлена! Вы можете перейти к публикации.",
-                         reply_markup=await reply_keyboards.create_keyboards(row=1, texts=reply_buttons))
+                         reply_markup=PUBLISH_REPLY_KEYBOARD)
     await state.set_state(AdminStates.go_to_publish_media)
 
 @admin.message(IsAdmin(), F.text == "❌ Отменить", AdminStates.go_to_publish_media)
@@ -546,78 +1012,99 @@ async def cancel_media_publish(message: Message, state: FSMContext) -> None:
     await state.clear()
 
 
-@admin.message(IsAdmin(), F.text == "✅ Опубликовать", AdminStates.go_to_publish_media)
+def media_markup(data: dict):
+    buttons = data.get("buttons", [])
+    return inline_keyboards.build_keyboards(buttons=buttons, row_width=1) if buttons else None
+
+@admin.message(IsAdmin(), F.text.in_({PUBLISH_TEXT, URGENT_TEXT}), AdminStates.go_to_publish_media)
 async def publish_media(message: Message, state: FSMContext) -> None:
     data = await state.get_data()
+    priority = "urgent" if message.text == URGENT_TEXT else "bulk"
 
     media_type = data["media_type"]
     media_id = data["media_id"]
+    album = data.get("album", [])
     caption = data.get("caption", "")
     buttons = data.get("buttons", [])
 
-    reply_markup = await inline_keyboards.create_keyboards(buttons=buttons, row_width=1) if buttons else None
-    chats = await get_all_users()
+    await message.answer("<b>Ваша публикация:</b>")
+    preview = await preflight(message, state,
+                              preview_media(message.bot, message.chat.id, data, caption, media_markup(data)))
+    if preview is None:
+        return
+    # Одиночное медиа рассылается копией превью; альбом copy_message не поддерживает.
+    template = preview if len(album) < 2 else None
 
     if data.get("choice_time_selected"):
         publication_date = data.get("publication_date")
         publication_time = data.get("publication_time")
 
         run_at = datetime.strptime(f"{publication_date} {publication_time}", "%Y-%m-%d %H:%M:%S")
-        run_at_str = run_at.isoformat()
 
-        await add_task(
-            run_at=f"{data.get('publication_date')} {data.get('publication_time')}",
+        task_id = await add_task(
+            run_at=run_at.isoformat(),
             news_text=caption,
-            button_text=buttons[0]["text"],
-            button_url=buttons[0]["url"],
-            file_data=media_id
+            button_text=buttons[0]["text"] if buttons else None,
+            button_url=buttons[0]["url"] if buttons else None,
+            file_data=media_id,
+            media_type=media_type,
+            author_id=message.chat.id,
+            segment=data.get("segment"),
+            priority=priority,
+            album=album if len(album) > 1 else None,
+            template_chat_id=template.chat.id if template else None,
+            template_message_id=template.message_id if template else None
         )
 
-        task = await get_task(run_at=run_at_str)
-
-        scheduler.add_job(
-            scheduled_send_media,
-            'date',
-            run_date=task['run_at'],
-            kwargs={
-                "message": message,
-                "file_data": task['media_id'],
-                "news_text": task['news_text'],
-                "task_id": task['id'],
-                "chats": chats,
-                "button_text": task['button_text'],
-                "button_url": task['button_url']
-            }
-        )
+        schedule_task(task_id, run_at)
 
-        await message.answer("<b>Ваша публикация</b>")
-        if media_type == "photo":
-            await message.answer_photo(photo=media_id, caption=caption, reply_markup=reply_markup)
-        elif media_type == "video":
-            await message.answer_video(video=media_id, caption=caption, reply_markup=reply_markup)
-        elif media_type == "audio":
-            await message.answer_audio(audio=media_id, caption=caption, reply_markup=reply_markup)
-        elif media_type == "document":
-            await message.answer_document(document=media_id, caption=caption, reply_markup=reply_markup)
-        await message.answer(f"будет отправлена в <b>{data['publication_date']} - {data['publication_time']}</b>")
+        await message.answer(f"будет отправлена в <b>{data['publication_date']} - {data['publication_time']}</b>",
+                             reply_markup=ReplyKeyboardRemove())
 
         return
 
-    for chat_id in chats:
-        try:
-            if media_type == "photo":
-                await message.bot.send_photo(chat_id=chat_id, photo=media_id, caption=caption, reply_markup=reply_markup)
-            elif media_type == "video":
-                await message.bot.send_video(chat_id=chat_id, video=media_id, caption=caption, reply_markup=reply_markup)
-            elif media_type == "audio":
-                await message.bot.send_audio(chat_id=chat_id, audio=media_id, caption=caption, reply_markup=reply_markup)
-            elif media_type == "document":
-                await message.bot.send_document(chat_id=chat_id, document=media_id, caption=caption, reply_markup=reply_markup)
-        except TelegramBadRequest:
-            await message.answer("Произошла ошибка, возможно, бот не является Админстратором чата.")
-
-    await message.answer("✅ Медиа успешно опубликовано!", reply_markup=ReplyKeyboardRemove())
+    task_id = await add_task(
+        run_at=datetime.now().isoformat(),
+        news_text=caption,
+        button_text=buttons[0]["text"] if buttons else None,
+        button_url=buttons[0]["url"] if buttons else None,
+        file_data=media_id,
+        media_type=media_type,
+        author_id=message.chat.id,
+        segment=data.get("segment"),
+        priority=priority,
+        album=album if len(album) > 1 else None,
+        template_chat_id=template.chat.id if template else None,
+        template_message_id=template.message_id if template else None
+    )
+    await message.answer(f"🚀 Медиа-публикация #{task_id} запущена, ход рассылки — в следующем сообщении.",
+                         reply_markup=ReplyKeyboardRemove())
     await state.clear()
+    start_broadcast(scheduled_send_media, message.bot, task_id)
+
+@admin.message(IsAdmin(), F.text == DRY_RUN_TEXT, AdminStates.go_to_publish_media)
+async def dry_run_media(message: Message, state: FSMContext) -> None:
+    data = await state.get_data()
+    album = data.get("album", [])
+    reply_markup = media_markup(data)
+
+    if await preflight(message, state, preview_media(message.bot, message.chat.id, data,
+                                                     data.get("caption", ""), reply_markup)) is None:
+        return
+
+    if len(album) > 1:
+        # Кнопка к альбому уходит отдельным сообщением.
+        await report_estimate(message, data.get("segment"), "sendMediaGroup", 2 if reply_markup else 1)
+    elif BROADCAST_TEMPLATE_MODE:
+        await report_estimate(message, data.get("segment"), "copyMessage")
+    else:
+        await report_estimate(message, data.get("segment"), f"send{data['media_type'].capitalize()}")
+
+@admin.callback_query(F.data == "dry_run_media", AdminStates.media_handle_state)
+async def dry_run_media_callback(callback: CallbackQuery, state: FSMContext) -> None:
+    await state.set_state(AdminStates.go_to_publish_media)
+    await dry_run_media(callback.message, state)
+    await callback.answer()
 
 @admin.callback_query(F.data == "go_to_publish_media")
 async def go_to_publish_media(callback: CallbackQuery, state: FSMContext) -> None:
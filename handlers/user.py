@@ -2,18 +2,28 @@ from aiogram import Router, F
 from aiogram.types.message import Message
 from aiogram.types import ChatMemberUpdated
 from aiogram.filters.command import CommandStart, Command
-from aiogram.filters import ChatMemberUpdatedFilter, JOIN_TRANSITION
+from aiogram.filters import ChatMemberUpdatedFilter, JOIN_TRANSITION, LEAVE_TRANSITION
 
-from database.requests import set_user, mark_user_as_client
+from helpers.registration import registration_buffer
+from database.requests import deactivate_users
 
 user = Router()
 
 @user.message(CommandStart())
 async def cmd_start(message: Message) -> None:
-    await set_user(message.from_user.id)
+    registration_buffer.register(message.from_user.id, "private", message.from_user.language_code)
     await message.answer("Добро пожаловать!")
 
 @user.my_chat_member(ChatMemberUpdatedFilter(member_status_changed=JOIN_TRANSITION))
 async def bot_added_to_group(event: ChatMemberUpdated) -> None:
     chat = event.chat
-    await set_user(chat.id)
\ No newline at end of file
+    language_code = event.from_user.language_code if chat.type == "private" else None
+    registration_buffer.register(chat.id, chat.type, language_code)
+
+@user.my_chat_member(ChatMemberUpdatedFilter(member_status_changed=LEAVE_TRANSITION))
+async def bot_removed_from_chat(event: ChatMemberUpdated) -> None:
+    if event.chat.type == "private":
+        reason = "blocked"
+    else:
+        reason = "kicked" if event.new_chat_member.status == "kicked" else "left"
+    await deactivate_users({event.chat.id: reason})
\ No newline at end of file
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+
+from database.requests import get_admin_ids, add_admins, remove_admin
+
+from config import ADMINS_IDS, ADMINS_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class AdminRegistry:
+    """
+    Админы из таблицы admins в памяти: проверка — поиск во frozenset без обращения к базе.
+    Устаревший снимок перечитывается в фоне, изменения из панели применяются сразу.
+    ADMINS_IDS из конфига — владельцы, их нельзя снять через панель.
+    """
+
+    def __init__(self, owners: list[int] = ADMINS_IDS, ttl: float = ADMINS_CACHE_TTL) -> None:
+        self.owners = frozenset(owners)
+        self.ttl = ttl
+        self._ids = self.owners
+        self._loaded_at = 0.0
+        self._refreshing: asyncio.Task | None = None
+
+    @property
+    def ids(self) -> frozenset[int]:
+        return self._ids
+
+    def is_admin(self, user_id: int) -> bool:
+        if time.monotonic() - self._loaded_at > self.ttl:
+            self.invalidate()
+        return user_id in self._ids
+
+    def is_owner(self, user_id: int) -> bool:
+        return user_id in self.owners
+
+    def invalidate(self) -> None:
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._refresh_quietly())
+
+    async def refresh(self) -> None:
+        self._ids = self.owners | frozenset(await get_admin_ids())
+        self._loaded_at = time.monotonic()
+
+    async def _refresh_quietly(self) -> None:
+        try:
+            await self.refresh()
+        except Exception:
+            logger.exception("Не удалось обновить список админов")
+
+    async def load(self) -> None:
+        await add_admins(list(self.owners))
+        await self.refresh()
+
+    async def add(self, user_id: int) -> bool:
+        added = bool(await add_admins([user_id]))
+        await self.refresh()
+        return added
+
+    async def remove(self, user_id: int) -> bool:
+        if self.is_owner(user_id):
+            raise ValueError("Нельзя удалить владельца бота из списка админов.")
+        removed = await remove_admin(user_id)
+        await self.refresh()
+        return removed
+
+
+admin_registry = AdminRegistry()
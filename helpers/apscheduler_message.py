@@ -0,0 +1,24 @@
+from aiogram import Bot
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from config import SCHEDULE_MISFIRE_GRACE
+
+scheduler = AsyncIOScheduler(job_defaults={
+    "misfire_grace_time": SCHEDULE_MISFIRE_GRACE,
+    "coalesce": True,
+})
+
+# Задачи планировщика получают только id, а бот подставляется при запуске.
+_bot: Bot | None = None
+
+
+def bind_bot(bot: Bot) -> None:
+    global _bot
+    _bot = bot
+
+
+def get_bot() -> Bot:
+    if _bot is None:
+        raise RuntimeError("Бот не привязан к планировщику.")
+    return _bot
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """
+    Копит записи в памяти и сбрасывает их пачкой по размеру буфера или по таймеру.
+    Неудачная пачка возвращается в буфер и повторяется со всё большей паузой.
+    """
+
+    max_retry_delay = 30.0
+    close_attempts = 3
+
+    def __init__(self, batch_size: int, interval: float) -> None:
+        self.batch_size = batch_size
+        self.interval = interval
+        self._buffer: list[Any] = []
+        self._lock = asyncio.Lock()
+        self._pending: set[asyncio.Task] = set()
+        self._closed = asyncio.Event()
+        self._ticker: asyncio.Task | None = None
+
+    async def write(self, items: list[Any]) -> None:
+        raise NotImplementedError
+
+    def add(self, item: Any) -> None:
+        self._buffer.append(item)
+        if len(self._buffer) >= self.batch_size:
+            flush = asyncio.create_task(self._try_flush())
+            self._pending.add(flush)
+            flush.add_done_callback(self._pending.discard)
+
+    async def flush(self) -> None:
+        async with self._lock:
+            items, self._buffer = self._buffer, []
+            if not items:
+                return
+            try:
+                await self.write(items)
+            except Exception:
+                # Пачка не теряется: записи возвращаются в начало буфера до следующей попытки.
+                self._buffer[:0] = items
+                raise
+
+    async def _try_flush(self) -> bool:
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("%s: не удалось записать %s записей, повторим позже",
+                             type(self).__name__, len(self._buffer))
+            return False
+        return True
+
+    async def _tick(self) -> None:
+        delay = self.interval
+        while not self._closed.is_set():
+            try:
+                await asyncio.wait_for(self._closed.wait(), delay)
+            except asyncio.TimeoutError:
+                if await self._try_flush():
+                    delay = self.interval
+                else:
+                    delay = min(delay * 2, self.max_retry_delay)
+
+    def start(self) -> None:
+        self._closed.clear()
+        self._ticker = asyncio.create_task(self._tick())
+
+    async def close(self) -> None:
+        self._closed.set()
+        if self._ticker is not None:
+            await self._ticker
+        await asyncio.gather(*self._pending, return_exceptions=True)
+        for attempt in range(self.close_attempts):
+            if await self._try_flush():
+                return
+            await asyncio.sleep(min(self.interval * 2 ** attempt, self.max_retry_delay))
+        logger.error("%s: при закрытии не записано %s записей", type(self).__name__, len(self._buffer))
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable
+
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+from helpers.retry import RetryPolicy, RetryQueue
+from helpers.journal import DeliveryJournal
+from helpers.metrics import broadcast_sent, broadcast_failed, broadcast_queue_depth, send_rate
+
+from database.requests import iter_users
+
+from config import (
+    BROADCAST_WORKERS,
+    BROADCAST_GLOBAL_RATE,
+    BROADCAST_CHAT_RATE,
+    BROADCAST_GROUP_RATE
+)
+
+logger = logging.getLogger(__name__)
+
+SendFunc = Callable[[int], Awaitable[Any]]
+ResultFunc = Callable[[int, Exception | None], Any]
+Chats = Iterable[int] | AsyncIterable[Iterable[int]]
+
+
+class SendDeferred(Exception):
+    """Часть отправки ушла, остаток ждёт delay секунд в очереди повторов, не занимая воркер."""
+
+    def __init__(self, delay: float) -> None:
+        super().__init__(delay)
+        self.delay = delay
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float = 1.0) -> None:
+        if rate <= 0:
+            raise ValueError("rate должен быть больше нуля.")
+
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """Глобальный лимит Bot API плюс отдельные лимиты на личный чат и на группу."""
+
+    sweep_threshold = 10_000
+
+    def __init__(self,
+                 global_rate: float = BROADCAST_GLOBAL_RATE,
+                 chat_rate: float = BROADCAST_CHAT_RATE,
+                 group_rate: float = BROADCAST_GROUP_RATE) -> None:
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_buckets: dict[int, TokenBucket] = {}
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.sweep_threshold:
+                self._sweep()
+            # У групп и каналов отрицательные id.
+            bucket = TokenBucket(self.group_rate if chat_id < 0 else self.chat_rate)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _sweep(self) -> None:
+        now = time.monotonic()
+        self.chat_buckets = {
+            chat_id: bucket for chat_id, bucket in self.chat_buckets.items()
+            if not bucket.is_full(now)
+        }
+
+    async def _wait_pause(self) -> None:
+        while (now := time.monotonic()) < self.paused_until:
+            await asyncio.sleep(self.paused_until - now)
+
+    async def acquire_global(self) -> None:
+        while True:
+            await self._wait_pause()
+            wait = self.global_bucket.delay(time.monotonic())
+            if wait <= 0:
+                self.global_bucket.consume()
+                return
+            await asyncio.sleep(wait)
+
+    def chat_delay(self, chat_id: int) -> float:
+        return self._chat_bucket(chat_id).delay(time.monotonic())
+
+    async def acquire(self, chat_id: int) -> None:
+        chat_bucket = self._chat_bucket(chat_id)
+        while (wait := chat_bucket.delay(time.monotonic())) > 0:
+            await asyncio.sleep(wait)
+        chat_bucket.consume()
+        await self.acquire_global()
+
+
+@dataclass
+class BroadcastResult:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    pruned: int = 0
+    errors: list[tuple[int, str]] = field(default_factory=list)
+    failed_shards: list[int] = field(default_factory=list)
+
+
+class Broadcaster:
+
+    def __init__(self,
+                 limiter: RateLimiter,
+                 workers: int = BROADCAST_WORKERS,
+                 policy: RetryPolicy | None = None) -> None:
+        if workers <= 0:
+            raise ValueError("workers должен быть больше нуля.")
+
+        self.limiter = limiter
+        self.workers = workers
+        self.policy = policy or RetryPolicy()
+
+    async def run(self,
+                  chats: Chats,
+                  send: SendFunc,
+                  on_result: ResultFunc | None = None) -> BroadcastResult:
+        result = BroadcastResult()
+        queue: asyncio.Queue[tuple[int, dict[str, int]] | None] = asyncio.Queue(maxsize=self.workers * 2)
+        retries = RetryQueue()
+        changed = asyncio.Event()
+        outstanding = 0
+        produced = False
+
+        def finish(chat_id: int, error: Exception | None = None) -> None:
+            nonlocal outstanding
+            outstanding -= 1
+            broadcast_queue_depth.inc("pending", value=-1)
+            changed.set()
+            if on_result is not None:
+                on_result(chat_id, error)
+
+        async def put(chat_id: int) -> None:
+            nonlocal outstanding
+            outstanding += 1
+            broadcast_queue_depth.inc("pending")
+            await queue.put((chat_id, {}))
+
+        async def produce() -> None:
+            nonlocal produced
+            if isinstance(chats, AsyncIterable):
+                async for chunk in chats:
+                    for chat_id in chunk:
+                        await put(chat_id)
+            else:
+                for chat_id in chats:
+                    await put(chat_id)
+            produced = True
+            changed.set()
+
+        async def requeue() -> None:
+            while not (produced and outstanding == 0):
+                delay = retries.next_delay()
+                if delay == 0:
+                    broadcast_queue_depth.inc("retry", value=-1)
+                    await queue.put(retries.pop())
+                    continue
+                changed.clear()
+                try:
+                    await asyncio.wait_for(changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            for _ in range(self.workers):
+                await queue.put(None)
+
+        async def work() -> None:
+            while (item := await queue.get()) is not None:
+                chat_id, attempts = item
+                await self.limiter.acquire(chat_id)
+                try:
+                    await send(chat_id)
+                except TelegramAPIError as e:
+                    error_class = self.policy.error_class(e)
+                    if error_class and self.policy.allows(error_class, attempts):
+                        delay = self.policy.delay(e, attempts.get(error_class, 0))
+                        if isinstance(e, TelegramRetryAfter):
+                            # Флуд-контроль действует на весь бот: притормаживаем всех воркеров.
+                            self.limiter.pause(e.retry_after)
+                        attempts[error_class] = attempts.get(error_class, 0) + 1
+                        retries.push(chat_id, attempts, delay)
+                        broadcast_queue_depth.inc("retry")
+                        result.retried += 1
+                        changed.set()
+                        continue
+                    result.failed += 1
+                    result.errors.append((chat_id, str(e)))
+                    broadcast_failed.inc()
+                    finish(chat_id, e)
+                except SendDeferred as e:
+                    # Не ошибка и не повтор: бюджеты не тратятся, результат запишется после остатка.
+                    retries.push(chat_id, attempts, e.delay)
+                    broadcast_queue_depth.inc("retry")
+                    changed.set()
+                except Exception as e:
+                    # Сбой не от Bot API (база, валидация): это провал одного получателя,
+                    # иначе воркер умрёт, а остальные продолжат слать без журнала.
+                    logger.exception("Ошибка отправки в чат %s", chat_id)
+                    result.failed += 1
+                    result.errors.append((chat_id, repr(e)))
+                    broadcast_failed.inc()
+                    finish(chat_id, e)
+                else:
+                    result.sent += 1
+                    broadcast_sent.inc()
+                    send_rate.mark()
+                    finish(chat_id)
+
+        tasks = [asyncio.create_task(coro) for coro in (produce(), requeue(), *(work() for _ in range(self.workers)))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Если упал продюсер или что-то ещё, остальные задачи не должны продолжать рассылку.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return result
+
+
+limiter = RateLimiter()
+broadcaster = Broadcaster(limiter)
+
+
+async def deliver(task_id: int,
+                  send: SendFunc,
+                  shard: tuple[int, int] | None = None,
+                  runner: Broadcaster = broadcaster,
+                  segment: dict | None = None,
+                  on_result: ResultFunc | None = None) -> BroadcastResult:
+    chats = iter_users(exclude_task_id=task_id, shard=shard, segment=segment)
+
+    async with DeliveryJournal(task_id) as journal:
+        def record(chat_id: int, error: Exception | None) -> None:
+            journal.record(chat_id, error)
+            if on_result is not None:
+                on_result(chat_id, error)
+
+        result = await runner.run(chats, send, on_result=record)
+    result.pruned = journal.pruned
+    return result
@@ -0,0 +1,178 @@
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from helpers.broadcast import RateLimiter, TokenBucket, limiter as default_limiter
+
+from config import CAMPAIGN_MAX_ACTIVE, CAMPAIGN_WEIGHTS, CAMPAIGN_PREEMPT
+
+# Порядок классов — порядок допуска в очередь.
+PRIORITIES = ("urgent", "bulk")
+
+
+class CampaignLimiter(RateLimiter):
+    """Лимитер одной рассылки: глобальный токен выдаёт планировщик, лимиты чатов и пауза после 429 — общие."""
+
+    def __init__(self, scheduler: "CampaignScheduler", campaign: "Campaign") -> None:
+        self.shared = scheduler.limiter
+        super().__init__(self.shared.global_bucket.rate, self.shared.chat_rate, self.shared.group_rate)
+        self.scheduler = scheduler
+        self.campaign = campaign
+
+    def pause(self, seconds: float) -> None:
+        self.shared.pause(seconds)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        return self.shared._chat_bucket(chat_id)
+
+    async def acquire_global(self) -> None:
+        await self.scheduler.acquire(self.campaign)
+
+
+class Campaign:
+
+    def __init__(self, scheduler: "CampaignScheduler", task_id: int, priority: str, seq: int) -> None:
+        if priority not in PRIORITIES:
+            raise ValueError(f"Неизвестный приоритет рассылки: {priority}.")
+
+        self.task_id = task_id
+        self.priority = priority
+        self.seq = seq
+        self.weight = scheduler.weights[priority]
+        self.state = "queued"
+        # Виртуальное время: токен получает идущая рассылка с наименьшим, шаг — 1 / вес.
+        self.vtime = 0.0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.running = asyncio.Event()
+        self.limiter = CampaignLimiter(scheduler, self)
+
+
+class CampaignScheduler:
+    """
+    Общая очередь рассылок вместо независимых гонок за лимит Bot API.
+    Одновременно идут не больше max_active рассылок; срочные допускаются первыми и при нехватке
+    мест вытесняют самую позднюю обычную. Глобальные токены делятся между идущими рассылками
+    пропорционально весу класса. Рассылку можно поставить на паузу и продолжить.
+    """
+
+    def __init__(self,
+                 limiter: RateLimiter = default_limiter,
+                 max_active: int = CAMPAIGN_MAX_ACTIVE,
+                 weights: dict[str, float] = CAMPAIGN_WEIGHTS,
+                 preempt: bool = CAMPAIGN_PREEMPT) -> None:
+        if max_active <= 0:
+            raise ValueError("max_active должен быть больше нуля.")
+
+        self.limiter = limiter
+        self.max_active = max_active
+        self.weights = weights
+        self.preempt = preempt
+        self.campaigns: dict[int, Campaign] = {}
+        self._seq = itertools.count()
+        self._vtime = 0.0
+        self._wake = asyncio.Event()
+        self._dispatcher: asyncio.Task | None = None
+
+    @staticmethod
+    def _rank(campaign: Campaign) -> tuple[int, int]:
+        return PRIORITIES.index(campaign.priority), campaign.seq
+
+    def ordered(self) -> list[Campaign]:
+        return sorted(self.campaigns.values(), key=self._rank)
+
+    def _set_state(self, campaign: Campaign, state: str) -> None:
+        campaign.state = state
+        if state == "running":
+            # Вернувшаяся рассылка не должна получить все токены за время простоя.
+            campaign.vtime = max(campaign.vtime, self._vtime)
+            campaign.running.set()
+        else:
+            campaign.running.clear()
+        self._wake.set()
+
+    def _schedule(self) -> None:
+        running = [campaign for campaign in self.campaigns.values() if campaign.state == "running"]
+        waiting = sorted(
+            (campaign for campaign in self.campaigns.values() if campaign.state in ("queued", "preempted")),
+            key=self._rank
+        )
+        for campaign in waiting:
+            if len(running) >= self.max_active and self.preempt and campaign.priority == "urgent":
+                victims = [other for other in running if other.priority != "urgent"]
+                if victims:
+                    victim = max(victims, key=lambda other: other.seq)
+                    self._set_state(victim, "preempted")
+                    running.remove(victim)
+            if len(running) >= self.max_active:
+                break
+            self._set_state(campaign, "running")
+            running.append(campaign)
+
+    def _ready(self) -> list[Campaign]:
+        return [campaign for campaign in self.campaigns.values() if campaign.state == "running" and campaign.waiters]
+
+    async def _dispatch(self) -> None:
+        while True:
+            if not self._ready():
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            await self.limiter.acquire_global()
+            # Пока ждали токен, рассылку могли поставить на паузу или вытеснить.
+            ready = self._ready()
+            if not ready:
+                continue
+            campaign = min(ready, key=lambda other: other.vtime)
+            self._vtime = campaign.vtime
+            campaign.vtime += 1 / campaign.weight
+            waiter = campaign.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def acquire(self, campaign: Campaign) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        campaign.waiters.append(waiter)
+        self._wake.set()
+        await waiter
+
+    @asynccontextmanager
+    async def campaign(self, task_id: int, priority: str = "bulk") -> AsyncIterator[Campaign]:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        campaign = Campaign(self, task_id, priority, next(self._seq))
+        self.campaigns[task_id] = campaign
+        self._schedule()
+        try:
+            yield campaign
+        finally:
+            del self.campaigns[task_id]
+            self._schedule()
+
+    def pause(self, task_id: int) -> bool:
+        campaign = self.campaigns.get(task_id)
+        if campaign is None or campaign.state == "paused":
+            return False
+        self._set_state(campaign, "paused")
+        self._schedule()
+        return True
+
+    def resume(self, task_id: int) -> bool:
+        campaign = self.campaigns.get(task_id)
+        if campaign is None or campaign.state != "paused":
+            return False
+        self._set_state(campaign, "queued")
+        self._schedule()
+        return True
+
+    async def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+
+campaign_scheduler = CampaignScheduler()
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from html import escape
+from typing import Iterable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+
+from config import CHAT_CACHE_TTL, CHAT_CACHE_MAX_STALE, CHAT_CACHE_SIZE, CHAT_CACHE_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ChatProfile:
+    id: int
+    title: str
+    username: str | None = None
+
+    def link(self) -> str:
+        if self.username:
+            return f"<a href='https://t.me/{self.username}'>{escape(self.title)}</a>"
+        if self.id > 0:
+            return f"<a href='tg://user?id={self.id}'>{escape(self.title)}</a>"
+        return escape(self.title)
+
+
+class ChatProfileCache:
+    """
+    Кэш профилей чатов (имя, username) поверх bot.get_chat.
+    Свежие записи отдаются сразу, устаревшие — тоже сразу, но обновляются в фоне;
+    промахи запрашиваются параллельно, не больше concurrency запросов одновременно.
+    """
+
+    def __init__(self,
+                 ttl: float = CHAT_CACHE_TTL,
+                 max_stale: float = CHAT_CACHE_MAX_STALE,
+                 size: int = CHAT_CACHE_SIZE,
+                 concurrency: int = CHAT_CACHE_CONCURRENCY) -> None:
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.size = size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._entries: OrderedDict[int, tuple[ChatProfile | None, float]] = OrderedDict()
+        self._pending: dict[int, asyncio.Future] = {}
+        self._background: set[asyncio.Task] = set()
+
+    def _store(self, chat_id: int, profile: ChatProfile | None) -> None:
+        self._entries[chat_id] = (profile, time.monotonic())
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    async def _fetch(self, bot: Bot, chat_id: int) -> ChatProfile | None:
+        async with self._semaphore:
+            try:
+                chat = await bot.get_chat(chat_id)
+            except TelegramAPIError as error:
+                logger.warning("Не удалось получить чат %s: %s", chat_id, error)
+                profile = None
+            else:
+                title = chat.title or " ".join(filter(None, (chat.first_name, chat.last_name))) or str(chat_id)
+                profile = ChatProfile(id=chat_id, title=title, username=chat.username)
+        self._store(chat_id, profile)
+        return profile
+
+    def _load(self, bot: Bot, chat_id: int) -> asyncio.Future:
+        # Одновременные запросы одного и того же чата сводятся к одному get_chat.
+        future = self._pending.get(chat_id)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(bot, chat_id))
+            self._pending[chat_id] = future
+            future.add_done_callback(lambda _: self._pending.pop(chat_id, None))
+        return future
+
+    def _revalidate(self, bot: Bot, chat_id: int) -> None:
+        if chat_id not in self._pending:
+            future = self._load(bot, chat_id)
+            self._background.add(future)
+            future.add_done_callback(self._background.discard)
+
+    async def get_many(self, bot: Bot, chat_ids: Iterable[int]) -> dict[int, ChatProfile | None]:
+        now = time.monotonic()
+        profiles: dict[int, ChatProfile | None] = {}
+        missing = []
+
+        for chat_id in dict.fromkeys(chat_ids):
+            entry = self._entries.get(chat_id)
+            if entry is None or now - entry[1] > self.ttl + self.max_stale:
+                missing.append(chat_id)
+                continue
+            profiles[chat_id] = entry[0]
+            if now - entry[1] > self.ttl:
+                self._revalidate(bot, chat_id)
+
+        if missing:
+            fetched = await asyncio.gather(*(self._load(bot, chat_id) for chat_id in missing))
+            profiles.update(zip(missing, fetched))
+        return profiles
+
+    async def get(self, bot: Bot, chat_id: int) -> ChatProfile | None:
+        return (await self.get_many(bot, [chat_id]))[chat_id]
+
+    def warm(self, bot: Bot, chat_ids: Iterable[int]) -> None:
+        for chat_id in chat_ids:
+            if chat_id not in self._entries:
+                self._revalidate(bot, chat_id)
+
+    def invalidate(self, chat_id: int) -> None:
+        self._entries.pop(chat_id, None)
+
+
+chat_profiles = ChatProfileCache()
@@ -0,0 +1,153 @@
+import copy
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Mapping
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from database.requests import get_fsm_record, save_fsm_records, replace_fsm_data
+from helpers.batching import BatchWriter
+
+from config import FSM_FLUSH_INTERVAL, FSM_BATCH_SIZE, FSM_CACHE_TTL, FSM_CACHE_SIZE, FSM_SHARED
+
+Record = tuple[str | None, dict[str, Any]]
+# Изменение data: получает копию текущих данных и возвращает новые, None — ничего не менять.
+DataChange = Callable[[dict[str, Any]], dict[str, Any] | None]
+
+
+class StateWriter(BatchWriter):
+    """Пишет в базу изменённые колонки ключей: несколько update_data подряд — одна запись."""
+
+    def __init__(self, storage: "SQLStorage", batch_size: int, interval: float) -> None:
+        super().__init__(batch_size, interval)
+        self.storage = storage
+
+    async def write(self, items: list[str]) -> None:
+        pending = self.storage._pending
+        versions = {key: self.storage._dirty[key] for key in dict.fromkeys(items) if key in pending}
+        await save_fsm_records({key: dict(pending[key]) for key in versions})
+        for key, version in versions.items():
+            if self.storage._dirty.get(key) == version:
+                del self.storage._dirty[key]
+                del pending[key]
+
+
+class SQLStorage(BaseStorage):
+    """
+    FSM в таблице fsm_states. set_state пишет только колонку state, set_data — только data, без чтения строки.
+    Один процесс бота (по умолчанию при polling): чтение из кэша в памяти, запись копится и батчем
+    уходит в базу, чистые ключи перечитываются после ttl, несохранённые из кэша не вытесняются.
+    shared (по умолчанию при webhook, апдейты одного чата попадают в разные процессы): кэша нет,
+    update_data и modify_data сравнивают версию data и повторяют изменение, если её успел поменять другой процесс.
+    """
+
+    def __init__(self,
+                 key_builder: KeyBuilder | None = None,
+                 ttl: float = FSM_CACHE_TTL,
+                 size: int = FSM_CACHE_SIZE,
+                 batch_size: int = FSM_BATCH_SIZE,
+                 interval: float = FSM_FLUSH_INTERVAL,
+                 shared: bool = FSM_SHARED) -> None:
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.ttl = ttl
+        self.shared = shared
+        self.size = size
+        self._records: OrderedDict[str, tuple[Record, float]] = OrderedDict()
+        self._pending: dict[str, dict[str, Any]] = {}
+        self._dirty: dict[str, int] = {}
+        self._writer = StateWriter(self, batch_size, interval)
+
+    def start(self) -> None:
+        self._writer.start()
+
+    async def close(self) -> None:
+        await self._writer.close()
+
+    def _remember(self, key: str, record: Record) -> None:
+        self._records[key] = (record, time.monotonic())
+        self._records.move_to_end(key)
+        while len(self._records) > self.size:
+            oldest = next(iter(self._records))
+            if oldest in self._dirty:
+                break
+            del self._records[oldest]
+
+    async def _record(self, key: StorageKey) -> Record:
+        name = self.key_builder.build(key)
+        if self.shared:
+            state, data, _ = await get_fsm_record(name) or (None, {}, None)
+            return state, data
+
+        cached = self._records.get(name)
+        if cached is not None and (name in self._dirty or time.monotonic() - cached[1] <= self.ttl):
+            return cached[0]
+
+        state, data, _ = await get_fsm_record(name) or (None, {}, None)
+        # Несохранённые колонки новее того, что лежит в базе.
+        pending = self._pending.get(name, {})
+        self._remember(name, (pending.get("state", state), pending.get("data", data)))
+        return self._records[name][0]
+
+    async def _write(self, key: StorageKey, **columns: Any) -> None:
+        name = self.key_builder.build(key)
+        if self.shared:
+            await save_fsm_records({name: columns})
+            return
+
+        cached = self._records.get(name)
+        if cached is not None:
+            state, data = cached[0]
+            self._remember(name, (columns.get("state", state), columns.get("data", data)))
+        self._pending.setdefault(name, {}).update(columns)
+        self._dirty[name] = self._dirty.get(name, 0) + 1
+        self._writer.add(name)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._write(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await self._record(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._write(key, data=copy.deepcopy(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await self._record(key)
+        return copy.deepcopy(data)
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        return await self.modify_data(key, lambda current: {**current, **data})
+
+    async def modify_data(self, key: StorageKey, change: DataChange) -> dict[str, Any] | None:
+        """Атомарное чтение-изменение-запись data. В shared change может вызываться несколько раз."""
+        if not self.shared:
+            # Апдейты одного чата в процессе идут по очереди (SimpleEventIsolation).
+            data = change(await self.get_data(key))
+            if data is not None:
+                await self.set_data(key, data)
+            return copy.deepcopy(data)
+
+        name = self.key_builder.build(key)
+        while True:
+            _, current, version = await get_fsm_record(name) or (None, {}, None)
+            data = change(current)
+            if data is None:
+                return None
+            if await replace_fsm_data(name, data, version):
+                return copy.deepcopy(data)
+
+
+async def modify_data(state: FSMContext, change: DataChange) -> dict[str, Any] | None:
+    """modify_data для любого хранилища FSM; у чужих хранилищ без атомарности между процессами."""
+    if isinstance(state.storage, SQLStorage):
+        return await state.storage.modify_data(state.key, change)
+    data = change(await state.get_data())
+    if data is not None:
+        await state.set_data(data)
+    return data
+
+
+fsm_storage = SQLStorage()
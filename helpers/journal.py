@@ -0,0 +1,59 @@
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+
+from database.requests import save_deliveries, deactivate_users
+from helpers.batching import BatchWriter
+
+from config import JOURNAL_BATCH_SIZE, JOURNAL_FLUSH_INTERVAL
+
+FORBIDDEN_REASONS = (
+    ("blocked by the user", "blocked"),
+    ("kicked", "kicked"),
+    ("user is deactivated", "deactivated"),
+)
+
+
+class DeliveryJournal(BatchWriter):
+    """Журнал доставок; недоступные чаты заодно помечаются неактивными тем же батчем."""
+
+    def __init__(self,
+                 task_id: int,
+                 batch_size: int = JOURNAL_BATCH_SIZE,
+                 interval: float = JOURNAL_FLUSH_INTERVAL) -> None:
+        super().__init__(batch_size, interval)
+        self.task_id = task_id
+        self.pruned = 0
+
+    @staticmethod
+    def inactive_reason(error: Exception | None) -> str | None:
+        if isinstance(error, TelegramForbiddenError):
+            message = error.message.lower()
+            for marker, reason in FORBIDDEN_REASONS:
+                if marker in message:
+                    return reason
+            return "forbidden"
+        if isinstance(error, TelegramBadRequest) and "chat not found" in error.message.lower():
+            return "chat_not_found"
+        return None
+
+    @classmethod
+    def status(cls, error: Exception | None) -> str:
+        if error is None:
+            return "sent"
+        if cls.inactive_reason(error):
+            return "blocked"
+        return "failed"
+
+    def record(self, chat_id: int, error: Exception | None = None) -> None:
+        self.add({
+            "task_id": self.task_id,
+            "chat_id": chat_id,
+            "status": self.status(error),
+            "error": str(error) if error else None,
+            "reason": self.inactive_reason(error),
+        })
+
+    async def write(self, items: list[dict]) -> None:
+        await save_deliveries([
+            {key: value for key, value in item.items() if key != "reason"} for item in items
+        ])
+        self.pruned += await deactivate_users({item["chat_id"]: item["reason"] for item in items if item["reason"]})
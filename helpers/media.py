@@ -0,0 +1,120 @@
+import asyncio
+import os
+
+from aiogram import Bot
+from aiogram.types import (
+    FSInputFile,
+    Message,
+    InputMediaPhoto,
+    InputMediaVideo,
+    InputMediaAudio,
+    InputMediaDocument
+)
+
+from database.requests import get_media_file_id, save_media_file_id
+
+MEDIA_EXTENSIONS = {
+    "photo": ('.jpg', '.jpeg', '.png'),
+    "audio": ('.mp3', '.wav'),
+    "video": ('.mp4',),
+}
+
+
+def guess_media_type(file_data: str) -> str:
+    # Только для старых задач, созданных до появления колонки media_type.
+    for media_type, extensions in MEDIA_EXTENSIONS.items():
+        if file_data.lower().endswith(extensions):
+            return media_type
+    return "document"
+
+
+def extract_file_id(message: Message, media_type: str) -> str:
+    if media_type == "photo":
+        return message.photo[-1].file_id
+    return getattr(message, media_type).file_id
+
+
+async def send_media(bot: Bot,
+                     chat_id: int,
+                     media_type: str,
+                     media,
+                     caption: str | None = None,
+                     reply_markup=None) -> Message:
+    if media_type == "photo":
+        return await bot.send_photo(chat_id=chat_id, photo=media, caption=caption, reply_markup=reply_markup)
+    if media_type == "video":
+        return await bot.send_video(chat_id=chat_id, video=media, caption=caption, reply_markup=reply_markup)
+    if media_type == "audio":
+        return await bot.send_audio(chat_id=chat_id, audio=media, caption=caption, reply_markup=reply_markup)
+    if media_type == "document":
+        return await bot.send_document(chat_id=chat_id, document=media, caption=caption, reply_markup=reply_markup)
+    raise ValueError(f"Неизвестный тип медиа: {media_type}")
+
+
+ALBUM_LIMIT = 10
+INPUT_MEDIA = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "audio": InputMediaAudio,
+    "document": InputMediaDocument,
+}
+# Telegram смешивает в одном альбоме только фото с видео; аудио и документы идут отдельными альбомами.
+ALBUM_KINDS = {"photo": "visual", "video": "visual", "audio": "audio", "document": "document"}
+
+
+def album_accepts(album: list[dict], media_type: str) -> bool:
+    if len(album) >= ALBUM_LIMIT:
+        return False
+    return not album or ALBUM_KINDS[album[0]["type"]] == ALBUM_KINDS[media_type]
+
+
+def build_album(album: list[dict], caption: str | None = None) -> list:
+    return [
+        INPUT_MEDIA[item["type"]](media=item["media"], caption=caption if index == 0 else None)
+        for index, item in enumerate(album)
+    ]
+
+
+async def send_album(bot: Bot, chat_id: int, album: list[dict], caption: str | None = None) -> list[Message]:
+    return await bot.send_media_group(chat_id=chat_id, media=build_album(album, caption))
+
+
+class MediaRegistry:
+    """Локальный файл загружается в Telegram один раз, дальше рассылка идёт по закешированному file_id."""
+
+    def __init__(self) -> None:
+        self._file_ids: dict[str, str] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    async def _cached(self, path: str) -> str | None:
+        if path not in self._file_ids:
+            file_id = await get_media_file_id(path)
+            if file_id:
+                self._file_ids[path] = file_id
+        return self._file_ids.get(path)
+
+    async def send(self,
+                   bot: Bot,
+                   chat_id: int,
+                   media_type: str,
+                   file_data: str,
+                   caption: str | None = None,
+                   reply_markup=None) -> Message:
+        if not os.path.isfile(file_data):
+            return await send_media(bot, chat_id, media_type, file_data, caption, reply_markup)
+
+        file_id = self._file_ids.get(file_data)
+        if file_id is None:
+            async with self._locks.setdefault(file_data, asyncio.Lock()):
+                file_id = await self._cached(file_data)
+                if file_id is None:
+                    message = await send_media(bot, chat_id, media_type, FSInputFile(file_data), caption, reply_markup)
+                    file_id = extract_file_id(message, media_type)
+                    self._file_ids[file_data] = file_id
+                    await save_media_file_id(file_data, media_type, file_id)
+                    return message
+
+        return await send_media(bot, chat_id, media_type, file_id, caption, reply_markup)
+
+
+media_registry = MediaRegistry()
@@ -0,0 +1,201 @@
+import bisect
+import functools
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+from aiogram.methods import TelegramMethod
+
+from config import METRICS_HOST, METRICS_PORT
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        registry.append(self)
+
+    def _labels(self, values: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, value: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0)
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{self._labels(labels)} {value}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, *args: Any, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+        self.counts: dict[tuple[str, ...], list[int]] = {}
+        self.sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self.counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labels] = self.sums.get(labels, 0) + value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels: str) -> int:
+        return sum(self.counts.get(labels, ()))
+
+    def quantile(self, q: float, *labels: str) -> float | None:
+        # Оценка сверху по границе бакета — для админки этого достаточно.
+        counts = self.counts.get(labels)
+        if not counts:
+            return None
+        rank = q * sum(counts)
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def samples(self) -> Iterator[str]:
+        for labels, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else str(bound)
+                le_label = f'le="{le}"'
+                yield f"{self.name}_bucket{self._labels(labels, le_label)} {cumulative}"
+            yield f"{self.name}_sum{self._labels(labels)} {self.sums[labels]}"
+            yield f"{self.name}_count{self._labels(labels)} {cumulative}"
+
+
+class RateMeter:
+    """Скользящее окно по секундам для «текущей» скорости в админке."""
+
+    def __init__(self, window: int = 60) -> None:
+        self.window = window
+        self.slots = [0] * window
+        self.stamps = [0] * window
+
+    def mark(self, value: int = 1) -> None:
+        second = int(time.time())
+        index = second % self.window
+        if self.stamps[index] != second:
+            self.stamps[index], self.slots[index] = second, 0
+        self.slots[index] += value
+
+    def rate(self) -> float:
+        now = int(time.time())
+        return sum(
+            count for count, stamp in zip(self.slots, self.stamps) if now - stamp < self.window
+        ) / self.window
+
+
+registry: list[Metric] = []
+
+api_requests = Counter("bot_api_requests_total", "Bot API requests by method.", ("method",))
+api_latency = Histogram("bot_api_latency_seconds", "Bot API request latency.", ("method",))
+api_flood_errors = Counter("bot_api_429_total", "Bot API flood-control (429) responses.")
+api_forbidden_errors = Counter("bot_api_403_total", "Bot API forbidden (403) responses.")
+broadcast_sent = Counter("broadcast_sent_total", "Broadcast messages delivered.")
+broadcast_failed = Counter("broadcast_failed_total", "Broadcast messages that finally failed.")
+broadcast_queue_depth = Gauge("broadcast_queue_depth", "Recipients waiting in broadcast queues.", ("queue",))
+send_rate = RateMeter()
+db_latency = Histogram("db_query_seconds", "database.requests call duration.", ("function",))
+http_connections = Counter("bot_http_connections_total", "Bot API connections by outcome.", ("outcome",))
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+def timed(func):
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with db_latency.time(func.__name__):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+class MetricsMiddleware(BaseRequestMiddleware):
+
+    async def __call__(self,
+                       make_request: NextRequestMiddlewareType,
+                       bot: Bot,
+                       method: TelegramMethod):
+        name = method.__api_method__
+        api_requests.inc(name)
+        try:
+            with api_latency.time(name):
+                return await make_request(bot, method)
+        except TelegramRetryAfter:
+            api_flood_errors.inc()
+            raise
+        except TelegramForbiddenError:
+            api_forbidden_errors.inc()
+            raise
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=host, port=port).start()
+    except OSError:
+        await runner.cleanup()
+        raise
+    return runner
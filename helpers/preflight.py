@@ -0,0 +1,41 @@
+import math
+from dataclasses import dataclass
+
+from helpers import metrics
+
+from config import BROADCAST_GLOBAL_RATE, BROADCAST_WORKERS
+
+
+@dataclass(frozen=True)
+class Estimate:
+    recipients: int
+    requests: int
+    seconds: float
+
+
+def estimate(recipients: int,
+             requests_per_chat: int = 1,
+             method: str = "sendMessage",
+             global_rate: float = BROADCAST_GLOBAL_RATE,
+             workers: int = BROADCAST_WORKERS) -> Estimate:
+    """
+    Оценка рассылки без отправки. Скорость упирается в глобальный лимит,
+    а при медленном API — в число воркеров (по медиане задержки метода из метрик).
+    """
+    requests = recipients * requests_per_chat
+    rate = global_rate
+    latency = metrics.api_latency.quantile(0.5, method)
+    if latency and math.isfinite(latency):
+        rate = min(rate, workers / latency)
+    return Estimate(recipients=recipients, requests=requests, seconds=requests / rate)
+
+
+def format_duration(seconds: float) -> str:
+    seconds = math.ceil(seconds)
+    if seconds < 60:
+        return f"{seconds} сек"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} мин {seconds} сек"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} ч {minutes} мин"
@@ -0,0 +1,186 @@
+import asyncio
+import csv
+import io
+import logging
+import re
+import time
+from collections import Counter
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import BufferedInputFile, Message
+
+from database.requests import get_delivery_counts, get_delivery_errors
+from helpers.broadcast import BroadcastResult, RateLimiter, limiter as default_limiter
+from helpers.journal import DeliveryJournal
+from helpers.preflight import format_duration
+
+from config import PROGRESS_INTERVAL, PROGRESS_TOP_ERRORS
+
+logger = logging.getLogger(__name__)
+
+ERROR_PREFIX = "Telegram server says - "
+
+
+def error_group(error: str | None) -> str:
+    # Числа (retry after 5, id чата) в группировке не важны.
+    return re.sub(r"\d+", "N", (error or "неизвестная ошибка").removeprefix(ERROR_PREFIX))
+
+
+class ProgressReporter:
+    """
+    Одно статусное сообщение у автора рассылки вместо сообщения на каждую ошибку.
+    Правится не чаще interval и берёт токен у того же лимитера, что и рассылка;
+    в конце — сводка ошибок по группам и CSV с подробностями по каждому чату.
+    """
+
+    title = "🚀 <b>Идёт рассылка</b>"
+
+    def __init__(self,
+                 bot: Bot,
+                 chat_id: int | None,
+                 task_id: int,
+                 total: int,
+                 interval: float = PROGRESS_INTERVAL,
+                 limiter: RateLimiter = default_limiter) -> None:
+        self.bot = bot
+        self.chat_id = chat_id
+        self.task_id = task_id
+        self.total = total
+        self.interval = interval
+        self.limiter = limiter
+        self.counts: dict[str, int] = {}
+        self.message: Message | None = None
+        self._text = ""
+        self._task: asyncio.Task | None = None
+        self._started = self._last_time = time.monotonic()
+        self._seed = self._last_done = 0
+        self._rate = 0.0
+
+    async def start(self) -> None:
+        if not self.chat_id:
+            return
+        # При возобновлении задачи часть чатов уже в журнале.
+        self.counts = await get_delivery_counts(self.task_id)
+        self._seed = self._last_done = sum(self.counts.values())
+        self._text = self.text(self.counts)
+        try:
+            self.message = await self.bot.send_message(self.chat_id, self._text)
+        except TelegramAPIError as error:
+            logger.warning("Не удалось отправить статус рассылки %s: %s", self.task_id, error)
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    def record(self, chat_id: int, error: Exception | None = None) -> None:
+        status = DeliveryJournal.status(error)
+        self.counts[status] = self.counts.get(status, 0) + 1
+
+    async def current_counts(self) -> dict[str, int]:
+        return self.counts
+
+    def text(self, counts: dict[str, int], final: bool = False) -> str:
+        sent = counts.get("sent", 0)
+        failed = counts.get("failed", 0) + counts.get("blocked", 0)
+        done = sent + failed
+        remaining = max(self.total - done, 0)
+        lines = [
+            "🏁 <b>Рассылка завершена</b>" if final else self.title,
+            "",
+            f"✅ Отправлено: {sent}",
+            f"❌ Не доставлено: {failed}",
+        ]
+        if final:
+            lines.append(f"⏱ Время: {format_duration(time.monotonic() - self._started)}")
+        else:
+            lines.append(f"⏳ Осталось: {remaining}")
+            lines.append(f"🚀 Скорость: {self._rate:.1f} сообщ./сек")
+            average = (done - self._seed) / max(time.monotonic() - self._started, 1e-9)
+            if remaining and average > 0:
+                lines.append(f"🕒 Примерно до конца: {format_duration(remaining / average)}")
+        return "\n".join(lines)
+
+    async def refresh(self, final: bool = False) -> None:
+        if self.message is None:
+            return
+        counts = await self.current_counts()
+        now = time.monotonic()
+        done = counts.get("sent", 0) + counts.get("failed", 0) + counts.get("blocked", 0)
+        self._rate = (done - self._last_done) / max(now - self._last_time, 1e-9)
+        self._last_done, self._last_time = done, now
+
+        text = self.text(counts, final)
+        if text == self._text:
+            return
+        await self.limiter.acquire_global()
+        try:
+            await self.message.edit_text(text)
+        except TelegramAPIError as error:
+            logger.warning("Не удалось обновить статус рассылки %s: %s", self.task_id, error)
+            return
+        self._text = text
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.refresh()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def finish(self, result: BroadcastResult) -> None:
+        await self.close()
+        if not self.chat_id:
+            return
+        await self.refresh(final=True)
+
+        errors = await get_delivery_errors(self.task_id) if result.failed else []
+        lines = []
+        if result.failed_shards:
+            lines.append(f"⚠️ Не завершились шарды: {', '.join(map(str, result.failed_shards))}. "
+                         f"Их получатели рассылку не получили.")
+        if result.pruned:
+            lines.append(f"🧹 Недоступных чатов исключено из рассылок: {result.pruned}.")
+        if errors:
+            groups = Counter(error_group(error) for _, _, error in errors)
+            lines.append("<b>Ошибки:</b>")
+            lines.extend(f"• {count} — {group}" for group, count in groups.most_common(PROGRESS_TOP_ERRORS))
+            if len(groups) > PROGRESS_TOP_ERRORS:
+                lines.append(f"• и ещё {len(groups) - PROGRESS_TOP_ERRORS} вид(ов) ошибок")
+        if not lines:
+            return
+
+        await self.limiter.acquire_global()
+        try:
+            await self.bot.send_message(self.chat_id, "\n".join(lines))
+            if errors:
+                await self.limiter.acquire_global()
+                await self.bot.send_document(
+                    self.chat_id,
+                    BufferedInputFile(self.errors_csv(errors), filename=f"broadcast_{self.task_id}_errors.csv"),
+                    caption="Подробности по каждому чату"
+                )
+        except TelegramAPIError as error:
+            logger.warning("Не удалось отправить итоги рассылки %s: %s", self.task_id, error)
+
+    @staticmethod
+    def errors_csv(errors: list[tuple[int, str, str | None]]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(("chat_id", "status", "error"))
+        for chat_id, status, error in errors:
+            writer.writerow((chat_id, status, (error or "").removeprefix(ERROR_PREFIX)))
+        return buffer.getvalue().encode()
+
+
+class ShardedProgressReporter(ProgressReporter):
+    """Для шардов в других процессах: счётчики берутся из журнала доставок."""
+
+    def __init__(self, *args, shards: int, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.title = f"🚀 <b>Рассылка идёт в {shards} процессах</b>"
+
+    async def current_counts(self) -> dict[str, int]:
+        return await get_delivery_counts(self.task_id)
@@ -0,0 +1,21 @@
+from database.requests import set_users
+from helpers.batching import BatchWriter
+
+from config import REGISTRATION_BATCH_SIZE, REGISTRATION_FLUSH_INTERVAL
+
+
+class RegistrationBuffer(BatchWriter):
+
+    def register(self, chat_id: int, chat_type: str = "private", language_code: str | None = None) -> None:
+        self.add({
+            "tg_id": chat_id,
+            # Супергруппа для сегментации — та же группа.
+            "chat_type": "group" if chat_type == "supergroup" else chat_type,
+            "language_code": language_code[:2].lower() if language_code else None,
+        })
+
+    async def write(self, items: list[dict]) -> None:
+        await set_users(list({item["tg_id"]: item for item in items}.values()))
+
+
+registration_buffer = RegistrationBuffer(REGISTRATION_BATCH_SIZE, REGISTRATION_FLUSH_INTERVAL)
@@ -0,0 +1,61 @@
+import heapq
+import itertools
+import random
+import time
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+
+from config import BROADCAST_RETRY_BASE_DELAY, BROADCAST_RETRY_MAX_DELAY, BROADCAST_RETRY_BUDGETS
+
+
+class RetryPolicy:
+
+    def __init__(self,
+                 budgets: dict[str, int] | None = None,
+                 base_delay: float = BROADCAST_RETRY_BASE_DELAY,
+                 max_delay: float = BROADCAST_RETRY_MAX_DELAY) -> None:
+        self.budgets = budgets if budgets is not None else dict(BROADCAST_RETRY_BUDGETS)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def error_class(exc: Exception) -> str | None:
+        if isinstance(exc, TelegramRetryAfter):
+            return "flood"
+        if isinstance(exc, TelegramNetworkError):
+            return "network"
+        if isinstance(exc, TelegramServerError):
+            return "server"
+        return None
+
+    def allows(self, error_class: str, attempts: dict[str, int]) -> bool:
+        return attempts.get(error_class, 0) < self.budgets.get(error_class, 0)
+
+    def delay(self, exc: Exception, attempt: int) -> float:
+        if isinstance(exc, TelegramRetryAfter):
+            # Сервер сам говорит, сколько ждать; джиттер разводит повторы по времени.
+            return exc.retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class RetryQueue:
+    """Куча отложенных повторов, упорядоченная по моменту готовности."""
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[float, int, int, dict[str, int]]] = []
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, chat_id: int, attempts: dict[str, int], delay: float) -> None:
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), chat_id, attempts))
+
+    def next_delay(self) -> float | None:
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def pop(self) -> tuple[int, dict[str, int]]:
+        _, _, chat_id, attempts = heapq.heappop(self._heap)
+        return chat_id, attempts
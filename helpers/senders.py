@@ -0,0 +1,89 @@
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from keyboards.admin import InlineKeyboardsControl
+from helpers.broadcast import SendDeferred, SendFunc, RateLimiter, limiter as default_limiter
+from helpers.media import media_registry, guess_media_type, build_album
+
+from config import BROADCAST_TEMPLATE_MODE
+
+inline_keyboards = InlineKeyboardsControl()
+
+ALBUM_BUTTON_TEXT = "⬇️"
+
+
+async def task_sender(bot: Bot,
+                      task: dict,
+                      limiter: RateLimiter = default_limiter,
+                      template_mode: bool = BROADCAST_TEMPLATE_MODE) -> SendFunc:
+    reply_markup = None
+    if task['button_text'] and task['button_url']:
+        reply_markup = inline_keyboards.build_keyboards([
+            {"text": task['button_text'], "url": task['button_url']}
+        ])
+
+    news_text = task['news_text']
+    file_data = task['file_data']
+    media_type = task['media_type'] or (guess_media_type(file_data) if file_data else None)
+
+    async def send_text(chat_id: int) -> None:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=news_text,
+            reply_markup=reply_markup
+        )
+
+    async def send_file(chat_id: int) -> None:
+        await media_registry.send(bot, chat_id, media_type, file_data, news_text, reply_markup)
+
+    if task['album']:
+        media = build_album(task['album'], news_text)
+        # Чаты, где альбом уже ушёл, а кнопка ещё нет: повтор после ошибки не дублирует альбом.
+        awaiting_button: set[int] = set()
+
+        async def send_album(chat_id: int) -> None:
+            if chat_id not in awaiting_button:
+                await bot.send_media_group(chat_id=chat_id, media=media)
+                if reply_markup is None:
+                    return
+                # У альбома не бывает клавиатуры, поэтому кнопка идёт отдельным сообщением
+                # и ждёт лимита чата в очереди повторов: воркер тем временем шлёт другим.
+                awaiting_button.add(chat_id)
+                raise SendDeferred(limiter.chat_delay(chat_id))
+
+            # Лимит чата и глобальный токен на кнопку воркер уже взял перед этим вызовом.
+            await bot.send_message(chat_id=chat_id, text=ALBUM_BUTTON_TEXT, reply_markup=reply_markup)
+            awaiting_button.discard(chat_id)
+
+        return send_album
+
+    send = send_file if file_data else send_text
+
+    if template_mode and task['template_message_id']:
+        template_chat_id = task['template_chat_id']
+        template_message_id = task['template_message_id']
+        use_template = True
+
+        # Копия превью, которое одобрил админ: в запросе только ссылка на сообщение,
+        # без текста, разметки и повторного разбора HTML на стороне Telegram.
+        async def send_copy(chat_id: int) -> None:
+            nonlocal use_template
+            if use_template:
+                try:
+                    await bot.copy_message(
+                        chat_id=chat_id,
+                        from_chat_id=template_chat_id,
+                        message_id=template_message_id,
+                        reply_markup=reply_markup
+                    )
+                    return
+                except TelegramBadRequest as error:
+                    # Превью удалили — дальше шлём содержимое задачи как обычно.
+                    if "message to copy not found" not in error.message.lower():
+                        raise
+                    use_template = False
+            await send(chat_id)
+
+        return send_copy
+
+    return send
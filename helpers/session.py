@@ -0,0 +1,99 @@
+import json
+from types import SimpleNamespace
+from typing import Any
+
+from aiohttp import ClientSession, ClientTimeout, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import Bot, __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.methods import TelegramMethod
+
+from helpers.metrics import http_connections
+
+from config import (
+    BOT_API_URL,
+    HTTP_POOL_SIZE,
+    HTTP_KEEPALIVE,
+    HTTP_DNS_TTL,
+    HTTP_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_ORJSON
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_codec(use_orjson: bool = HTTP_ORJSON) -> dict[str, Any]:
+    if use_orjson and orjson is not None:
+        return {"json_loads": orjson.loads, "json_dumps": lambda value: orjson.dumps(value).decode()}
+    return {"json_loads": json.loads, "json_dumps": json.dumps}
+
+
+async def _on_created(session: ClientSession, context: SimpleNamespace, params: Any) -> None:
+    http_connections.inc("created")
+
+
+async def _on_reused(session: ClientSession, context: SimpleNamespace, params: Any) -> None:
+    http_connections.inc("reused")
+
+
+async def _on_queued(session: ClientSession, context: SimpleNamespace, params: Any) -> None:
+    http_connections.inc("queued")
+
+
+def connection_trace() -> TraceConfig:
+    trace = TraceConfig()
+    trace.on_connection_create_end.append(_on_created)
+    trace.on_connection_reuseconn.append(_on_reused)
+    trace.on_connection_queued_start.append(_on_queued)
+    return trace
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """AiohttpSession с пулом под параллельность рассылки и счётчиками переиспользования соединений."""
+
+    def __init__(self,
+                 pool_size: int = HTTP_POOL_SIZE,
+                 keepalive: float = HTTP_KEEPALIVE,
+                 dns_ttl: int = HTTP_DNS_TTL,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 **kwargs: Any) -> None:
+        super().__init__(limit=pool_size, **kwargs)
+        self.connect_timeout = connect_timeout
+        if self.proxy is None:
+            self._connector_init.update(
+                limit_per_host=pool_size,
+                keepalive_timeout=keepalive,
+                ttl_dns_cache=dns_ttl
+            )
+
+    async def create_session(self) -> ClientSession:
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+                trace_configs=[connection_trace()]
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None) -> Any:
+        # Числовой таймаут aiohttp трактует как total, поэтому connect добавляем явно.
+        total = self.timeout if timeout is None else timeout
+        return await super().make_request(bot, method, ClientTimeout(total=total, connect=self.connect_timeout))
+
+
+def create_session(api_url: str = BOT_API_URL, **kwargs: Any) -> AiohttpSession:
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    if api_url:
+        kwargs.setdefault("api", TelegramAPIServer.from_base(api_url))
+    return TunedAiohttpSession(**json_codec(), **kwargs)
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.client.bot import DefaultBotProperties
+from aiogram.enums.parse_mode import ParseMode
+
+from database.requests import (
+    get_task,
+    get_delivery_counts,
+    claim_rate_tokens,
+    create_shards,
+    claim_shard,
+    heartbeat_shard,
+    finish_shard,
+    release_shards,
+    get_shards
+)
+from helpers.broadcast import RateLimiter, Broadcaster, BroadcastResult, deliver
+from helpers.senders import task_sender
+from helpers.metrics import MetricsMiddleware, db_latency
+from helpers.session import create_session
+
+from config import (
+    BROADCAST_WORKERS,
+    BROADCAST_SHARDS,
+    BROADCAST_LOCAL_SHARDS,
+    RATE_LEASE_SIZE,
+    SHARD_HEARTBEAT,
+    SHARD_LEASE_TIMEOUT,
+    SHARD_MAX_ATTEMPTS,
+    SHARD_POLL_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LeasedRateLimiter(RateLimiter):
+    """Общий на все процессы глобальный лимит: токены на текущую секунду берутся пачками из rate_leases."""
+
+    def __init__(self, lease_size: int = RATE_LEASE_SIZE, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.limit = max(1, int(self.global_bucket.rate))
+        self.lease_size = min(lease_size, self.limit)
+        self.window = 0
+        self.tokens = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire_global(self) -> None:
+        async with self._lock:
+            while True:
+                await self._wait_pause()
+                window = int(time.time())
+                if window != self.window:
+                    self.window, self.tokens = window, 0
+                if self.tokens > 0:
+                    self.tokens -= 1
+                    return
+                if await claim_rate_tokens(window, self.lease_size, self.limit):
+                    self.tokens = self.lease_size
+                    continue
+                await asyncio.sleep(window + 1 - time.time())
+
+
+async def run_shard(bot: Bot, task_id: int, index: int, count: int) -> BroadcastResult:
+    task = await get_task(task_id)
+    if not task:
+        return BroadcastResult()
+
+    limiter = LeasedRateLimiter()
+    send = await task_sender(bot, task, limiter)
+    runner = Broadcaster(limiter, workers=max(1, BROADCAST_WORKERS // count))
+    return await deliver(task_id, send, shard=(index, count), runner=runner, segment=task['segment'])
+
+
+async def keep_alive(task_id: int, index: int, owner: str) -> None:
+    while True:
+        await asyncio.sleep(SHARD_HEARTBEAT)
+        try:
+            await heartbeat_shard(task_id, index, owner)
+        except Exception:
+            logger.exception("Не удалось продлить аренду шарда %s задачи %s", index, task_id)
+
+
+async def serve_shards(token: str,
+                       parse_mode: str | None,
+                       owner: str,
+                       task_id: int | None = None,
+                       forever: bool = False) -> None:
+    """Забирает свободные шарды из shard_leases и рассылает их, пока они есть (или всегда, если forever)."""
+    bot = Bot(token=token, session=create_session(), default=DefaultBotProperties(parse_mode=parse_mode))
+    bot.session.middleware(MetricsMiddleware())
+    try:
+        while True:
+            claimed = await claim_shard(owner, SHARD_LEASE_TIMEOUT, SHARD_MAX_ATTEMPTS, task_id)
+            if claimed is None:
+                if not forever:
+                    return
+                await asyncio.sleep(SHARD_POLL_INTERVAL)
+                continue
+
+            claimed_task, index, count = claimed
+            heartbeat = asyncio.create_task(keep_alive(claimed_task, index, owner))
+            db_before = sum(db_latency.sums.values())
+            try:
+                await run_shard(bot, claimed_task, index, count)
+            except Exception as error:
+                logger.exception("Шард %s задачи %s упал", index, claimed_task)
+                await release_shards(owner, repr(error), SHARD_MAX_ATTEMPTS)
+            else:
+                await finish_shard(claimed_task, index, owner, sum(db_latency.sums.values()) - db_before)
+            finally:
+                heartbeat.cancel()
+    finally:
+        await bot.session.close()
+
+
+def shard_main(token: str, parse_mode: str | None, owner: str, task_id: int | None = None) -> None:
+    asyncio.run(serve_shards(token, parse_mode, owner, task_id))
+
+
+def make_owner(suffix: str = "") -> str:
+    return f"{socket.gethostname()}:{os.getpid()}{suffix}"
+
+
+async def run_sharded(bot: Bot,
+                      task: dict,
+                      shards: int = BROADCAST_SHARDS,
+                      local_shards: int = BROADCAST_LOCAL_SHARDS) -> BroadcastResult:
+    """
+    Делит рассылку на shards шардов в shard_leases и ждёт, пока все они завершатся.
+    Локальные процессы и воркеры на других репликах (CLI ниже) забирают шарды сами;
+    упавший процесс возвращает свой шард в очередь, протухшая аренда забирается заново.
+    """
+    await create_shards(task['id'], shards)
+
+    context = multiprocessing.get_context("spawn")
+    processes: dict[str, multiprocessing.Process] = {}
+    numbers = itertools.count()
+
+    def spawn() -> None:
+        owner = make_owner(f":{next(numbers)}")
+        process = context.Process(
+            target=shard_main,
+            args=(bot.token, bot.default.parse_mode, owner, task['id']),
+            daemon=True
+        )
+        process.start()
+        processes[owner] = process
+
+    for _ in range(min(local_shards, shards)):
+        spawn()
+
+    # Прогресс показывает ShardedProgressReporter: он читает тот же журнал доставок.
+    while True:
+        await asyncio.sleep(SHARD_POLL_INTERVAL)
+        for owner, process in list(processes.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del processes[owner]
+            if process.exitcode != 0:
+                logger.warning("Процесс шардов %s задачи %s завершился с кодом %s", owner, task['id'], process.exitcode)
+                await release_shards(owner, f"процесс завершился с кодом {process.exitcode}", SHARD_MAX_ATTEMPTS)
+
+        leases = await get_shards(task['id'])
+        if all(lease['status'] in ("done", "failed") for lease in leases):
+            break
+
+        stale_before = datetime.now() - timedelta(seconds=SHARD_LEASE_TIMEOUT)
+        claimable = any(
+            lease['status'] == "pending" or (lease['status'] == "running" and (lease['heartbeat_at'] or datetime.min) < stale_before)
+            for lease in leases
+        )
+        if claimable and local_shards > 0 and not processes:
+            spawn()
+
+    counts = await get_delivery_counts(task['id'])
+
+    return BroadcastResult(
+        sent=counts.get("sent", 0),
+        failed=counts.get("failed", 0) + counts.get("blocked", 0),
+        pruned=counts.get("blocked", 0),
+        failed_shards=[lease['shard'] for lease in leases if lease['status'] == "failed"]
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Воркер шардов рассылки для отдельной реплики: забирает свободные шарды из базы."
+    )
+    parser.add_argument("--task", type=int, default=None, help="только эта задача; выход, когда шардов не осталось")
+    args = parser.parse_args()
+
+    asyncio.run(serve_shards(os.getenv("TESTS_TOKEN_API"), ParseMode.HTML, make_owner(), args.task,
+                             forever=args.task is None))
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from typing import Any
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_WORKERS,
+    WEBHOOK_REGISTER
+)
+
+logger = logging.getLogger(__name__)
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """Складывает апдейты в ограниченную очередь, которую разбирает фиксированный пул воркеров."""
+
+    def __init__(self,
+                 dispatcher: Dispatcher,
+                 bot: Bot,
+                 secret_token: str,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE,
+                 workers: int = WEBHOOK_WORKERS,
+                 **data: Any) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue(maxsize=queue_size)
+        self.workers = workers
+        self._workers: list[asyncio.Task] = []
+
+    def register(self, app: web.Application, /, path: str, **kwargs: Any) -> None:
+        app.on_startup.append(self._start_workers)
+        super().register(app, path, **kwargs)
+
+    async def _start_workers(self, *args: Any) -> None:
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def _work(self) -> None:
+        while (update := await self.queue.get()) is not None:
+            try:
+                await self._background_feed_update(bot=self.bot, update=update)
+            except Exception:
+                logger.exception("Не удалось обработать апдейт из webhook.")
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже, а очередь не разрастается без предела.
+            return web.Response(status=429)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        for _ in self._workers:
+            await self.queue.put(None)
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await super().close()
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("Для режима webhook нужно задать WEBHOOK_SECRET.")
+
+    app = web.Application()
+    QueuedRequestHandler(dispatcher=dispatcher, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dispatcher, bot=bot)
+
+    if WEBHOOK_REGISTER:
+        await bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+            drop_pending_updates=True
+        )
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT, reuse_port=True).start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -1,4 +1,5 @@
-from typing import List, Dict, Union
+from functools import lru_cache
+from typing import List, Dict, Union, Tuple
 from aiogram.types import (
     InlineKeyboardMarkup,
     InlineKeyboardButton,
@@ -6,28 +7,31 @@ from aiogram.types import (
     ReplyKeyboardMarkup
 )
 
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from typing import List, Dict, Union
+from config import KEYBOARD_CACHE_SIZE
 
+ButtonSpec = Tuple[Union[str, None], Union[str, None], Union[str, None]]
 
-class InlineKeyboardsControl:
 
-    @classmethod
-    async def create_keyboards(cls,
-                               buttons: List[Dict[str, Union[str, None]]],
-                               row_width: int = 2) -> InlineKeyboardMarkup:
+class FrozenInlineKeyboardMarkup(InlineKeyboardMarkup, frozen=True):
+    pass
+
+
+class FrozenReplyKeyboardMarkup(ReplyKeyboardMarkup, frozen=True):
+    pass
+
+
+class InlineKeyboardsControl:
 
+    @staticmethod
+    @lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+    def _build(spec: Tuple[ButtonSpec, ...], row_width: int) -> InlineKeyboardMarkup:
         if row_width <= 0:
             raise ValueError("row_width должен быть больше нуля.")
 
         inline_keyboard = []
         row = []
 
-        for index, button in enumerate(buttons, start=1):
-            text = button.get("text")
-            callback = button.get("callback")
-            url = button.get("url")
-
+        for index, (text, callback, url) in enumerate(spec, start=1):
             if not text:
                 raise ValueError("Кнопка должна содержать текст.")
             if not callback and not url:
@@ -42,32 +46,28 @@ class InlineKeyboardsControl:
         if row:
             inline_keyboard.append(row)
 
-        return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+        return FrozenInlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+    @classmethod
+    def build_keyboards(cls,
+                        buttons: List[Dict[str, Union[str, None]]],
+                        row_width: int = 2) -> InlineKeyboardMarkup:
+        spec = tuple((button.get("text"), button.get("callback"), button.get("url")) for button in buttons)
+        return cls._build(spec, row_width)
 
     @classmethod
-    async def create_keyboard(cls,
-                              text: str,
-                              callback: str | None = None,
-                              url: str | None = None
-                              ) -> InlineKeyboardMarkup:
-        if not text:
-            raise ValueError("Кнопка должна содержать текст.")
-        if not callback and not url:
-            raise ValueError(f"Кнопка '{text}' должна содержать либо callback, либо url.")
-
-        ikb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=text, callback_data=callback, url=url)]
-        ])
-
-        return ikb
+    def build_keyboard(cls,
+                       text: str,
+                       callback: str | None = None,
+                       url: str | None = None
+                       ) -> InlineKeyboardMarkup:
+        return cls._build(((text, callback, url),), 1)
 
 class ReplyKeyboardsControl:
 
-    @classmethod
-    async def create_keyboards(cls,
-                              row: int,
-                              texts: List[str]
-                              ) -> ReplyKeyboardMarkup:
+    @staticmethod
+    @lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+    def _build(row: int, texts: Tuple[str, ...]) -> ReplyKeyboardMarkup:
         if row <= 0:
             raise ValueError("Количество кнопок в строке должно быть больше нуля.")
 
@@ -75,13 +75,17 @@ class ReplyKeyboardsControl:
             [KeyboardButton(text=texts[i + j]) for j in range(row) if i + j < len(texts)]
             for i in range(0, len(texts), row)
         ]
-        return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True, one_time_keyboard=True)
+        return FrozenReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True, one_time_keyboard=True)
+
+    @classmethod
+    def build_keyboards(cls,
+                        row: int,
+                        texts: List[str]
+                        ) -> ReplyKeyboardMarkup:
+        return cls._build(row, tuple(texts))
 
     @classmethod
-    async def create_keyboard(cls,
-                              text: str
-                              ) -> ReplyKeyboardMarkup:
-        kb = ReplyKeyboardMarkup(keyboard=[
-            [KeyboardButton(text=text)]
-        ], resize_keyboard=True, one_time_keyboard=True)
-        return kb
\ No newline at end of file
+    def build_keyboard(cls,
+                       text: str
+                       ) -> ReplyKeyboardMarkup:
+        return cls._build(1, (text,))
\ No newline at end of file
@@ -1,29 +1,84 @@
 import os
 import asyncio
+import logging
 
 from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import SimpleEventIsolation
 from aiogram.client.bot import DefaultBotProperties
 from aiogram.enums.parse_mode import ParseMode
 
-from handlers.admin import scheduler
+from handlers.admin import restore_scheduled_tasks, stop_broadcasts
+from helpers.apscheduler_message import scheduler, bind_bot
 
 from database.models import async_main
+from database.requests import init_stats
+from helpers.registration import registration_buffer
+from helpers.admins import admin_registry
+from helpers.chats import chat_profiles
+from helpers.fsm_storage import fsm_storage
+from helpers.campaigns import campaign_scheduler
+from helpers.webhook import run_webhook
+from helpers.metrics import MetricsMiddleware, start_metrics_server
+from helpers.session import create_session
+
+from config import UPDATES_MODE, METRICS_PORT, BOT_API_URL
 
 from handlers.admin import admin
 from handlers.user import user
 
+metrics_runners = []
+
+logger = logging.getLogger(__name__)
+
+def create_bot(token: str | None = None, api_url: str = BOT_API_URL) -> Bot:
+    bot = Bot(token=token or os.getenv("TESTS_TOKEN_API"),
+              session=create_session(api_url),
+              default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(MetricsMiddleware())
+    return bot
+
 async def main() -> None:
-    bot = Bot(token=os.getenv("TESTS_TOKEN_API"), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dp = Dispatcher()
+    bot = create_bot()
+    # Альбом приходит пачкой апдейтов: без изоляции они затирают друг другу черновик в FSM.
+    dp = Dispatcher(storage=fsm_storage, events_isolation=SimpleEventIsolation())
     dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
     dp.include_routers(admin, user)
 
+    if UPDATES_MODE == "webhook":
+        await run_webhook(dp, bot)
+        return
+
     await bot.delete_webhook(drop_pending_updates=True)
     await dp.start_polling(bot)
 
-async def on_startup(dispatcher) -> None:
-    scheduler.start()
+async def on_startup(bot: Bot) -> None:
     await async_main()
+    await init_stats()
+    await admin_registry.load()
+    chat_profiles.warm(bot, admin_registry.ids)
+    registration_buffer.start()
+    fsm_storage.start()
+    bind_bot(bot)
+    scheduler.start()
+    await restore_scheduled_tasks(bot)
+    if METRICS_PORT:
+        try:
+            metrics_runners.append(await start_metrics_server())
+        except OSError as error:
+            # Без метрик бот работает, из-за занятого порта не падаем.
+            logger.warning("Сервер метрик не запущен на порту %s: %s", METRICS_PORT, error)
+
+async def on_shutdown() -> None:
+    # Сначала рассылки: отменённые дописывают журналы, пока очередь рассылок ещё жива.
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    await stop_broadcasts()
+    await registration_buffer.close()
+    await fsm_storage.close()
+    await campaign_scheduler.close()
+    for runner in metrics_runners:
+        await runner.cleanup()
 
 if __name__ == "__main__":
     try:
@@ -15,4 +15,9 @@ class AdminStates(StatesGroup):
     media_handle_state = State()
     adding_link_button = State()
     adding_link_url = State()
-    go_to_publish_media = State()
\ No newline at end of file
+    go_to_publish_media = State()
+    add_admin = State()
+    remove_admin = State()
+    choice_segment = State()
+    segment_language = State()
+    segment_tag = State()
\ No newline at end of file
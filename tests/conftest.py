@@ -0,0 +1,29 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# До импорта database.models: тесты с базой работают с временной SQLite, а не с db.sqlite3 бота.
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='newsletter-tests-')}/db.sqlite3"
+
+
+@pytest.fixture
+def db():
+    """Запускает сценарий на чистой базе; соединения закрываются вместе с циклом событий."""
+    from database.models import Base, async_main, engine
+
+    def run(scenario):
+        async def wrapper():
+            await async_main()
+            async with engine.begin() as connection:
+                for table in reversed(Base.metadata.sorted_tables):
+                    await connection.execute(table.delete())
+            try:
+                return await scenario()
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(wrapper())
+
+    return run
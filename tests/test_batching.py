@@ -0,0 +1,61 @@
+import asyncio
+
+from helpers.batching import BatchWriter
+
+
+class FlakyWriter(BatchWriter):
+
+    def __init__(self, failures: int, batch_size: int = 100, interval: float = 0.01) -> None:
+        super().__init__(batch_size, interval)
+        self.failures = failures
+        self.written: list[int] = []
+
+    async def write(self, items: list[int]) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database is locked")
+        self.written.extend(items)
+
+
+def test_failed_write_keeps_items():
+    async def scenario() -> None:
+        writer = FlakyWriter(failures=1)
+        writer.add(1)
+        try:
+            await writer.flush()
+        except RuntimeError:
+            pass
+        writer.add(2)
+        await writer.flush()
+        assert writer.written == [1, 2]
+
+    asyncio.run(scenario())
+
+
+def test_ticker_survives_failed_write():
+    async def scenario() -> None:
+        writer = FlakyWriter(failures=2)
+        writer.start()
+        writer.add(1)
+        await asyncio.sleep(0.05)
+        writer.add(2)
+        writer.add(3)
+        await asyncio.sleep(0.3)
+        # Таймер пережил ошибки и дописал всё без вызова close().
+        assert writer.written == [1, 2, 3]
+        await writer.close()
+
+    asyncio.run(scenario())
+
+
+def test_size_triggered_failure_is_retried():
+    async def scenario() -> None:
+        writer = FlakyWriter(failures=1, batch_size=2, interval=10)
+        writer.add(1)
+        writer.add(2)
+        await asyncio.sleep(0.01)
+        assert writer.written == []
+        await writer.close()
+        assert writer.written == [1, 2]
+
+    asyncio.run(scenario())
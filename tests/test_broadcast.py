@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from helpers.broadcast import Broadcaster, RateLimiter, SendDeferred
+from helpers.retry import RetryPolicy
+
+METHOD = SendMessage(chat_id=1, text="test")
+
+
+def make_broadcaster(workers: int = 3) -> Broadcaster:
+    limiter = RateLimiter(global_rate=1e6, chat_rate=1e6, group_rate=1e6)
+    policy = RetryPolicy(budgets={"flood": 2, "network": 2, "server": 2}, base_delay=0.001, max_delay=0.001)
+    return Broadcaster(limiter, workers=workers, policy=policy)
+
+
+def test_unexpected_error_fails_only_one_chat():
+    sent = []
+
+    async def send(chat_id: int) -> None:
+        if chat_id == 3:
+            raise ValueError("broken payload")
+        sent.append(chat_id)
+
+    results = {}
+    result = asyncio.run(make_broadcaster().run(range(49), send, on_result=results.__setitem__))
+
+    assert result.sent == 48
+    assert result.failed == 1
+    assert isinstance(results[3], ValueError)
+    assert sorted(sent) == [chat_id for chat_id in range(49) if chat_id != 3]
+
+
+def test_failed_producer_stops_workers():
+    sent = []
+
+    async def chats():
+        yield range(5)
+        raise RuntimeError("database is locked")
+
+    async def send(chat_id: int) -> None:
+        await asyncio.sleep(0.01)
+        sent.append(chat_id)
+
+    async def scenario() -> None:
+        with pytest.raises(RuntimeError):
+            await make_broadcaster().run(chats(), send)
+        count = len(sent)
+        await asyncio.sleep(0.05)
+        # После ошибки ни один воркер не продолжает слать.
+        assert len(sent) == count
+        assert all(task is asyncio.current_task() for task in asyncio.all_tasks())
+
+    asyncio.run(scenario())
+
+
+def test_flood_error_is_retried():
+    attempts = {}
+
+    async def send(chat_id: int) -> None:
+        attempts[chat_id] = attempts.get(chat_id, 0) + 1
+        if attempts[chat_id] == 1:
+            raise TelegramRetryAfter(method=METHOD, message="Too Many Requests", retry_after=0)
+
+    result = asyncio.run(make_broadcaster().run(range(5), send))
+
+    assert result.sent == 5
+    assert result.retried == 5
+    assert result.failed == 0
+
+
+def test_retry_budget_is_limited():
+    async def send(chat_id: int) -> None:
+        raise TelegramRetryAfter(method=METHOD, message="Too Many Requests", retry_after=0)
+
+    result = asyncio.run(make_broadcaster().run([1], send))
+
+    assert result.retried == 2
+    assert result.failed == 1
+
+
+def test_forbidden_error_is_not_retried():
+    calls = []
+
+    async def send(chat_id: int) -> None:
+        calls.append(chat_id)
+        raise TelegramForbiddenError(method=METHOD, message="Forbidden: bot was blocked by the user")
+
+    result = asyncio.run(make_broadcaster().run([1, 2], send))
+
+    assert sorted(calls) == [1, 2]
+    assert result.failed == 2
+    assert result.retried == 0
+
+
+def test_deferred_send_frees_worker_and_finishes_once():
+    calls = []
+    results = []
+
+    async def send(chat_id: int) -> None:
+        calls.append(chat_id)
+        if calls.count(chat_id) == 1:
+            raise SendDeferred(0.01)
+
+    result = asyncio.run(make_broadcaster(workers=1).run(range(3), send, on_result=lambda *args: results.append(args)))
+
+    assert sorted(calls) == [0, 0, 1, 1, 2, 2]
+    # Пока первые чаты ждали, воркер успел начать следующие.
+    assert calls[:3] == [0, 1, 2]
+    assert result.sent == 3
+    assert result.retried == 0
+    assert sorted(results) == [(0, None), (1, None), (2, None)]
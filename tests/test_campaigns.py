@@ -0,0 +1,99 @@
+import asyncio
+
+from helpers.broadcast import RateLimiter
+from helpers.campaigns import CampaignScheduler
+
+
+def make_scheduler(max_active: int = 1, global_rate: float = 1e6) -> CampaignScheduler:
+    limiter = RateLimiter(global_rate=global_rate, chat_rate=1e6, group_rate=1e6)
+    return CampaignScheduler(limiter, max_active=max_active, weights={"urgent": 4, "bulk": 1}, preempt=True)
+
+
+def test_urgent_preempts_bulk_and_bulk_resumes():
+    async def scenario() -> None:
+        scheduler = make_scheduler()
+        try:
+            async with scheduler.campaign(1, "bulk") as bulk:
+                assert bulk.state == "running"
+
+                async with scheduler.campaign(2, "urgent") as urgent:
+                    assert urgent.state == "running"
+                    assert bulk.state == "preempted"
+                    assert not bulk.running.is_set()
+
+                    # Вытесненная рассылка не получает токенов, пока идёт срочная.
+                    waiter = asyncio.create_task(bulk.limiter.acquire_global())
+                    await asyncio.sleep(0.01)
+                    assert not waiter.done()
+                    await asyncio.wait_for(urgent.limiter.acquire_global(), 1)
+
+                assert bulk.state == "running"
+                await asyncio.wait_for(waiter, 1)
+        finally:
+            await scheduler.close()
+
+    asyncio.run(scenario())
+
+
+def test_bulk_waits_behind_running_bulk():
+    async def scenario() -> None:
+        scheduler = make_scheduler()
+        try:
+            async with scheduler.campaign(1, "bulk"):
+                async with scheduler.campaign(2, "bulk") as second:
+                    assert second.state == "queued"
+        finally:
+            await scheduler.close()
+
+    asyncio.run(scenario())
+
+
+def test_pause_and_resume():
+    async def scenario() -> None:
+        scheduler = make_scheduler(max_active=2)
+        try:
+            async with scheduler.campaign(1, "bulk") as campaign:
+                assert scheduler.pause(1)
+                assert not scheduler.pause(1)
+                assert campaign.state == "paused"
+
+                waiter = asyncio.create_task(campaign.limiter.acquire_global())
+                await asyncio.sleep(0.01)
+                assert not waiter.done()
+
+                assert scheduler.resume(1)
+                assert not scheduler.resume(1)
+                assert campaign.state == "running"
+                await asyncio.wait_for(waiter, 1)
+
+            assert not scheduler.pause(1)
+        finally:
+            await scheduler.close()
+
+    asyncio.run(scenario())
+
+
+def test_tokens_are_shared_by_weight():
+    grants = {"urgent": 0, "bulk": 0}
+
+    async def worker(campaign) -> None:
+        while True:
+            await campaign.limiter.acquire_global()
+            grants[campaign.priority] += 1
+
+    async def scenario() -> None:
+        scheduler = make_scheduler(max_active=2, global_rate=2000)
+        try:
+            async with scheduler.campaign(1, "bulk") as bulk, scheduler.campaign(2, "urgent") as urgent:
+                workers = [asyncio.create_task(worker(campaign)) for campaign in (bulk, urgent) for _ in range(3)]
+                await asyncio.sleep(0.3)
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            await scheduler.close()
+
+    asyncio.run(scenario())
+
+    assert grants["bulk"] > 0
+    assert 3 <= grants["urgent"] / grants["bulk"] <= 5
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+from database.requests import (
+    add_task,
+    get_delivery_counts,
+    iter_users,
+    mark_task_executed,
+    prune_deliveries,
+    save_deliveries,
+    set_users,
+)
+
+
+async def collect(**kwargs) -> list[list[int]]:
+    return [chunk async for chunk in iter_users(**kwargs)]
+
+
+def delivery(task_id: int, chat_id: int, status: str = "sent") -> dict:
+    return {"task_id": task_id, "chat_id": chat_id, "status": status, "error": None}
+
+
+def test_resume_starts_from_first_undelivered_chat(db):
+    async def scenario() -> None:
+        await set_users([{"tg_id": tg_id} for tg_id in range(1, 11)])
+        task_id = await add_task(run_at=datetime.now().isoformat(), news_text="test")
+        # Прерванная рассылка: первые четыре чата и седьмой уже в журнале.
+        await save_deliveries([delivery(task_id, chat_id) for chat_id in (1, 2, 3, 4, 7)])
+
+        assert await collect(exclude_task_id=task_id, chunk_size=3) == [[5, 6, 8], [9, 10]]
+        # Журнал другой задачи на выборку не влияет.
+        other_id = await add_task(run_at=datetime.now().isoformat(), news_text="other")
+        assert await collect(exclude_task_id=other_id, chunk_size=20) == [list(range(1, 11))]
+
+    db(scenario)
+
+
+def test_prune_keeps_recent_errors_only(db):
+    async def scenario() -> None:
+        old_id = await add_task(run_at=datetime.now().isoformat(), news_text="old")
+        await save_deliveries([delivery(old_id, 1, "failed")])
+        await mark_task_executed(old_id)
+
+        task_id = await add_task(run_at=datetime.now().isoformat(), news_text="test")
+        await save_deliveries([delivery(task_id, 1), delivery(task_id, 2), delivery(task_id, 3, "blocked")])
+        await mark_task_executed(task_id, sent=2, failed=1)
+
+        assert await prune_deliveries(task_id, timedelta(days=7)) == 2
+        assert await get_delivery_counts(task_id) == {"blocked": 1}
+        assert await get_delivery_counts(old_id) == {"failed": 1}
+
+        # Ошибки рассылок старше срока хранения удаляются при следующей очистке.
+        assert await prune_deliveries(task_id, timedelta(seconds=-1)) == 2
+        assert await get_delivery_counts(task_id) == {}
+        assert await get_delivery_counts(old_id) == {}
+
+    db(scenario)
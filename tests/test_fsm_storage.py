@@ -0,0 +1,104 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from database.requests import get_fsm_record
+from helpers import fsm_storage
+from helpers.fsm_storage import SQLStorage
+
+KEY = StorageKey(bot_id=1, chat_id=2, user_id=2)
+
+
+def counting(monkeypatch, name: str) -> list:
+    calls = []
+    original = getattr(fsm_storage, name)
+
+    async def wrapper(*args, **kwargs):
+        calls.append(args)
+        return await original(*args, **kwargs)
+
+    monkeypatch.setattr(fsm_storage, name, wrapper)
+    return calls
+
+
+def test_processes_see_each_other_writes(db):
+    async def scenario() -> None:
+        first, second = SQLStorage(shared=True), SQLStorage(shared=True)
+        await first.set_state(KEY, "Wizard:text")
+        await first.set_data(KEY, {"text": "hello"})
+        assert await second.get_state(KEY) == "Wizard:text"
+        assert await second.get_data(KEY) == {"text": "hello"}
+
+        await second.set_state(KEY, "Wizard:publish")
+        assert await first.get_state(KEY) == "Wizard:publish"
+        assert await first.get_data(KEY) == {"text": "hello"}
+
+    db(scenario)
+
+
+def test_concurrent_updates_from_processes_are_not_lost(db):
+    async def scenario() -> None:
+        first, second = SQLStorage(shared=True), SQLStorage(shared=True)
+        await asyncio.gather(first.update_data(KEY, {"album": ["a"]}), second.update_data(KEY, {"caption": "c"}))
+        assert await first.get_data(KEY) == {"album": ["a"], "caption": "c"}
+
+        # Части альбома из разных процессов дописываются, а не затирают друг друга.
+        def append(item: str):
+            return lambda data: {**data, "album": [*data["album"], item]}
+
+        storages = [first, second] * 5
+        await asyncio.gather(*(storage.modify_data(KEY, append(str(index))) for index, storage in enumerate(storages)))
+        album = (await second.get_data(KEY))["album"]
+        assert sorted(album) == sorted(["a", *map(str, range(10))])
+
+    db(scenario)
+
+
+def test_set_state_does_not_read_or_overwrite_data(db, monkeypatch):
+    async def scenario() -> None:
+        cached, other = SQLStorage(interval=60), SQLStorage(shared=True)
+        assert await cached.get_data(KEY) == {}
+        await other.set_data(KEY, {"album": ["a"]})
+
+        reads = counting(monkeypatch, "get_fsm_record")
+        await cached.set_state(KEY, "Wizard:text")
+        await cached._writer.flush()
+        assert reads == []
+        assert await other.get_state(KEY) == "Wizard:text"
+        assert await other.get_data(KEY) == {"album": ["a"]}
+
+    db(scenario)
+
+
+def test_cache_coalesces_writes(db, monkeypatch):
+    async def scenario() -> None:
+        storage, other = SQLStorage(interval=60), SQLStorage(shared=True)
+        writes = counting(monkeypatch, "save_fsm_records")
+        await storage.set_state(KEY, "Wizard:text")
+        for index in range(3):
+            await storage.update_data(KEY, {f"field{index}": index})
+        assert await storage.get_data(KEY) == {"field0": 0, "field1": 1, "field2": 2}
+        assert writes == []
+        assert await other.get_state(KEY) is None
+
+        await storage._writer.flush()
+        assert len(writes) == 1
+        assert await other.get_state(KEY) == "Wizard:text"
+        assert await other.get_data(KEY) == {"field0": 0, "field1": 1, "field2": 2}
+
+    db(scenario)
+
+
+def test_cleared_record_is_deleted(db):
+    async def scenario() -> None:
+        storage = SQLStorage(shared=True)
+        await storage.set_state(KEY, "Wizard:text")
+        await storage.update_data(KEY, {"text": "hello"})
+        name = storage.key_builder.build(KEY)
+        assert await get_fsm_record(name) is not None
+
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        assert await get_fsm_record(name) is None
+
+    db(scenario)
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime
+
+from database.requests import add_task, claim_shard, create_shards, finish_shard, get_shards, release_shards
+
+
+async def new_task(shards: int) -> int:
+    task_id = await add_task(run_at=datetime.now().isoformat(), news_text="test")
+    await create_shards(task_id, shards)
+    return task_id
+
+
+async def statuses(task_id: int) -> list[str]:
+    return [lease["status"] for lease in await get_shards(task_id)]
+
+
+def test_concurrent_claimers_get_distinct_shards(db):
+    async def scenario() -> None:
+        task_id = await new_task(3)
+        claims = await asyncio.gather(*(claim_shard(f"host:{pid}", 60, 3) for pid in range(4)))
+
+        claimed = [claim for claim in claims if claim is not None]
+        assert sorted(claimed) == [(task_id, 0, 3), (task_id, 1, 3), (task_id, 2, 3)]
+        assert claims.count(None) == 1
+        assert await statuses(task_id) == ["running"] * 3
+
+    db(scenario)
+
+
+def test_stale_lease_is_taken_over(db):
+    async def scenario() -> None:
+        task_id = await new_task(1)
+        assert await claim_shard("host:1", 60, 3) == (task_id, 0, 1)
+        assert await claim_shard("host:2", 60, 3) is None
+
+        # host:1 перестал слать heartbeat.
+        await asyncio.sleep(0.05)
+        assert await claim_shard("host:2", 0.01, 3) == (task_id, 0, 1)
+
+        # Запоздавший прежний владелец шард уже не закрывает.
+        await finish_shard(task_id, 0, "host:1")
+        assert await statuses(task_id) == ["running"]
+        await finish_shard(task_id, 0, "host:2")
+        assert await statuses(task_id) == ["done"]
+        assert await claim_shard("host:3", 0, 3) is None
+
+    db(scenario)
+
+
+def test_shard_fails_after_max_attempts(db):
+    async def scenario() -> None:
+        task_id = await new_task(1)
+        assert await claim_shard("host:1", 60, 2) is not None
+        await asyncio.sleep(0.05)
+        assert await claim_shard("host:2", 0.01, 2) is not None
+        await asyncio.sleep(0.05)
+
+        assert await claim_shard("host:3", 0.01, 2) is None
+        [lease] = await get_shards(task_id)
+        assert lease["status"] == "failed"
+        assert lease["error"] == "аренда шарда истекла"
+
+    db(scenario)
+
+
+def test_crashed_owner_releases_its_shards(db):
+    async def scenario() -> None:
+        task_id = await new_task(2)
+        await claim_shard("host:1", 60, 2)
+        await claim_shard("host:2", 60, 2)
+
+        await release_shards("host:1", "код выхода 1", 2)
+        shards = await get_shards(task_id)
+        assert [lease["status"] for lease in shards] == ["pending", "running"]
+        assert shards[0]["error"] == "код выхода 1"
+
+        # Вторая попытка тоже падает — попытки кончились.
+        assert await claim_shard("host:3", 60, 2) == (task_id, 0, 2)
+        await release_shards("host:3", "код выхода 1", 2)
+        assert await statuses(task_id) == ["failed", "running"]
+        assert await claim_shard("host:4", 60, 2) is None
+
+    db(scenario)
@@ -0,0 +1,45 @@
+import asyncio
+from datetime import datetime
+
+from database.requests import add_task, claim_task, get_stale_tasks, heartbeat_task, mark_task_executed, release_task
+
+
+def test_only_one_process_claims_a_task(db):
+    async def scenario() -> None:
+        task_id = await add_task(run_at=datetime.now().isoformat(), news_text="test")
+        claims = await asyncio.gather(*(claim_task(task_id, f"host:{pid}", 60) for pid in range(5)))
+        assert sorted(claims) == [False] * 4 + [True]
+
+    db(scenario)
+
+
+def test_stale_task_is_taken_over(db):
+    async def scenario() -> None:
+        task_id = await add_task(run_at=datetime.now().isoformat(), news_text="test")
+        assert await claim_task(task_id, "host:1", 60)
+        await heartbeat_task(task_id, "host:1")
+        assert not await claim_task(task_id, "host:2", 60)
+        assert await get_stale_tasks(60) == []
+
+        # Упавший процесс перестал продлевать аренду.
+        await asyncio.sleep(0.05)
+        assert await get_stale_tasks(0.01) == [task_id]
+        assert await claim_task(task_id, "host:2", 0.01)
+        assert not await claim_task(task_id, "host:1", 60)
+
+    db(scenario)
+
+
+def test_released_task_can_be_claimed_and_executed_cannot(db):
+    async def scenario() -> None:
+        task_id = await add_task(run_at=datetime.now().isoformat(), news_text="test")
+        assert await claim_task(task_id, "host:1", 60)
+        await release_task(task_id, "host:1")
+        assert await get_stale_tasks(0) == []
+        assert await claim_task(task_id, "host:2", 60)
+
+        assert await mark_task_executed(task_id, sent=1)
+        assert not await mark_task_executed(task_id)
+        assert not await claim_task(task_id, "host:3", 0)
+
+    db(scenario)